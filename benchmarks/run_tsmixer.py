@@ -1,4 +1,5 @@
 import argparse
+import itertools
 import os
 import time
 from typing import Any, List
@@ -18,7 +19,8 @@ from tpk.testing.datasets.m5 import (
     PREDICTION_LENGTH,
     TEST_START,
     VAL_START,
-    evaluate_wrmsse,
+    WRMSSEAccumulator,
+    get_wrmsse_evaluator,
     load_datasets,
 )
 
@@ -96,20 +98,18 @@ def evaluate(
     )
 
     if debug:
-        forecasts = [next(forecast_it)] * len(dataset)
-    else:
-        forecasts = list(tqdm(forecast_it, total=len(dataset)))
-
-    forecasts_acc = np.zeros((len(forecasts), PREDICTION_LENGTH))
-    if isinstance(
-        forecasts[0], (PTDistributionForecast, QuantileForecast)
-    ):  # MXDistributionForecast,
-        for i in range(len(forecasts)):
-            forecasts_acc[i] = forecasts[i].mean
-    else:
-        for i in range(len(forecasts)):
-            forecasts_acc[i] = np.mean(forecasts[i].samples, axis=0)
-    wrmsse = evaluate_wrmsse(data_dir, forecasts_acc, prediction_start, score_only=True)
+        forecast_it = itertools.repeat(next(forecast_it), len(dataset))
+
+    evaluator = get_wrmsse_evaluator(data_dir, prediction_start)
+    accumulator = WRMSSEAccumulator(evaluator)
+    for forecast in tqdm(forecast_it, total=len(dataset)):
+        if isinstance(
+            forecast, (PTDistributionForecast, QuantileForecast)
+        ):  # MXDistributionForecast,
+            accumulator.update(forecast.mean)
+        else:
+            accumulator.update(np.mean(forecast.samples, axis=0))
+    wrmsse = accumulator.score(score_only=True)
     return wrmsse
 
 
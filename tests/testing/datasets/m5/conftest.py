@@ -0,0 +1,24 @@
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+import pytest
+
+from tpk.testing.datasets.m5 import PREDICTION_LENGTH, VAL_START, generate_m5_dataset
+
+
+@pytest.fixture(scope="module")
+def synthetic_m5_dir(tmp_path_factory: Any) -> str:
+    """Directory with a small synthetic M5 dataset, shared by a test module."""
+    data_dir: Path = tmp_path_factory.mktemp("m5_")
+    generate_m5_dataset(data_dir, scale=0.01)
+    return str(data_dir)
+
+
+@pytest.fixture(scope="module")
+def y_true(synthetic_m5_dir: str) -> Any:
+    """Sales of the synthetic dataset in the validation period."""
+    sales = pd.read_csv(Path(synthetic_m5_dir) / "sales_train_evaluation.csv")
+    return sales[
+        [f"d_{i}" for i in range(VAL_START, VAL_START + PREDICTION_LENGTH)]
+    ].values
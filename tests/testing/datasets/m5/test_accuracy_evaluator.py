@@ -0,0 +1,91 @@
+from typing import Any
+
+import numpy as np
+
+from tpk.testing.datasets.m5 import (
+    PREDICTION_LENGTH,
+    TEST_START,
+    VAL_START,
+    WRMSSEAccumulator,
+    WRMSSEBacktestEvaluator,
+    evaluate_wrmsse,
+    get_wrmsse_evaluator,
+)
+
+
+def test_wrmsse_evaluator(synthetic_m5_dir: str, y_true: Any) -> None:
+    evaluator = get_wrmsse_evaluator(synthetic_m5_dir, VAL_START)
+    assert get_wrmsse_evaluator(synthetic_m5_dir, VAL_START) is evaluator
+    np.testing.assert_array_equal(evaluator.y_true, y_true)
+
+    prediction = y_true + 1.0
+    assert evaluator.evaluate(prediction) == evaluate_wrmsse(
+        synthetic_m5_dir, prediction, VAL_START
+    )
+
+
+def test_wrmsse_evaluate_batch(synthetic_m5_dir: str, y_true: Any) -> None:
+    evaluator = get_wrmsse_evaluator(synthetic_m5_dir, VAL_START)
+
+    predictions = np.stack([y_true, y_true + 1.0, np.zeros_like(y_true)])
+    scores, per_level = evaluator.evaluate_batch(predictions, per_level=True)
+    assert per_level.shape == (3, 12)
+    np.testing.assert_allclose(
+        scores, [evaluator.evaluate(p) for p in predictions], rtol=1e-12
+    )
+    np.testing.assert_allclose(per_level.sum(axis=1) / 12, scores, rtol=1e-12)
+
+
+def test_wrmsse_accumulator(synthetic_m5_dir: str, y_true: Any) -> None:
+    evaluator = get_wrmsse_evaluator(synthetic_m5_dir, VAL_START)
+    prediction = y_true + 1.0
+
+    accumulator = WRMSSEAccumulator(evaluator)
+    accumulator.update(prediction[:100])
+    for means in prediction[100:]:
+        accumulator.update(means)
+    assert accumulator.score() == evaluator.evaluate(prediction)
+
+
+def test_wrmsse_per_level_report(synthetic_m5_dir: str, y_true: Any) -> None:
+    evaluator = get_wrmsse_evaluator(synthetic_m5_dir, VAL_START)
+    prediction = y_true + 1.0
+    _, per_level = evaluator.evaluate_batch(prediction[None], per_level=True)
+
+    score, aggregated, aggregated_per_day, raw = evaluator.evaluate(
+        prediction, score_only=False, return_raw=False
+    )
+    assert raw is None
+    assert aggregated_per_day.shape == (12, PREDICTION_LENGTH)
+    np.testing.assert_allclose(aggregated, per_level[0], rtol=1e-12)
+    np.testing.assert_allclose(aggregated.sum() / 12, score, rtol=1e-12)
+
+    # integer forecasts give the same report as their float values
+    int_prediction = evaluator.y_true + 1
+    assert int_prediction.dtype.kind == "i"
+    int_report = evaluator.evaluate(int_prediction, score_only=False)
+    float_report = evaluator.evaluate(
+        int_prediction.astype(np.float64), score_only=False
+    )
+    for int_value, float_value in zip(int_report, float_report):
+        np.testing.assert_allclose(int_value, float_value, rtol=1e-12)
+
+
+def test_wrmsse_backtest_evaluator(synthetic_m5_dir: str, y_true: Any) -> None:
+    evaluator = get_wrmsse_evaluator(synthetic_m5_dir, VAL_START)
+    prediction = y_true + 1.0
+
+    backtest = WRMSSEBacktestEvaluator(synthetic_m5_dir, [TEST_START, VAL_START])
+    test_evaluator = get_wrmsse_evaluator(synthetic_m5_dir, TEST_START)
+    np.testing.assert_array_equal(backtest.sw[0], test_evaluator.sw)
+    np.testing.assert_array_equal(backtest.sw[1], evaluator.sw)
+    backtest_predictions = np.stack([test_evaluator.y_true + 1.0, prediction])
+    scores = backtest.evaluate(backtest_predictions)
+    np.testing.assert_allclose(
+        scores,
+        [
+            test_evaluator.evaluate(backtest_predictions[0]),
+            evaluator.evaluate(prediction),
+        ],
+        rtol=1e-12,
+    )
@@ -0,0 +1,58 @@
+import os
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import List
+
+import pytest
+
+from tpk.testing.datasets.m5 import cache
+from tpk.testing.datasets.m5.cache import _hash_file, ensure_artifact, is_artifact_fresh
+from tpk.utils.cache import atomic_path
+
+
+def test_ensure_artifact(monkeypatch: pytest.MonkeyPatch) -> None:
+    with TemporaryDirectory(prefix="m5_") as tmpdir:
+        source = Path(tmpdir) / "source.csv"
+        source.write_text("a,b\n1,2\n")
+        builds: List[int] = []
+
+        def build() -> int:
+            with atomic_path(Path(tmpdir) / "derived.txt") as tmp_file:
+                tmp_file.write_text(source.read_text().upper())
+            builds.append(1)
+            return len(builds)
+
+        def ensure() -> object:
+            return ensure_artifact(
+                tmpdir, "derived.txt", ["source.csv"], ["derived.txt"], build
+            )
+
+        assert ensure() == 1
+        assert ensure() is None
+        assert is_artifact_fresh(tmpdir, "derived.txt", ["source.csv"], ["derived.txt"])
+
+        # touching the source does not invalidate the artifact, and the source
+        # is hashed only once after it was touched
+        hashed: List[Path] = []
+
+        def hash_file(path: Path) -> str:
+            hashed.append(path)
+            return _hash_file(path)
+
+        monkeypatch.setattr(cache, "_hash_file", hash_file)
+        stat = source.stat()
+        os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert ensure() is None
+        assert hashed == [source]
+        assert ensure() is None
+        assert hashed == [source]
+
+        # changing the content does, even with the same size
+        source.write_text("a,b\n3,4\n")
+        assert ensure() == 2
+        assert (Path(tmpdir) / "derived.txt").read_text() == "A,B\n3,4\n"
+
+        # a deleted output is rebuilt
+        (Path(tmpdir) / "derived.txt").unlink()
+        assert ensure() == 3
+        assert sorted(p.name for p in Path(tmpdir).glob("derived*")) == ["derived.txt"]
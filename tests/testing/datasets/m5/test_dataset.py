@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+from gluonts.dataset.field_names import FieldName
+
+from tpk.testing.datasets.m5 import M5Dataset
+
+
+def test_m5_dataset_views() -> None:
+    target = np.arange(3 * 10, dtype=np.float32).reshape(3, 10)
+    price_features = np.ones((3, 2, 12), dtype=np.float32)
+    calendar_features = np.zeros((5, 12), dtype=np.float32)
+    stat_cat = np.arange(3 * 5, dtype=np.int32).reshape(3, 5)
+
+    dataset = M5Dataset(
+        target=target,
+        price_features=price_features,
+        calendar_features=calendar_features,
+        stat_cat=stat_cat,
+    )
+    train_ds = dataset.with_length(8)
+
+    assert len(train_ds) == 3
+    entries = list(train_ds)
+    assert len(entries) == 3
+
+    entry = entries[1]
+    assert entry[FieldName.START] == pd.Period("2011-01-29", freq="D")
+    np.testing.assert_array_equal(entry[FieldName.TARGET], target[1, :8])
+    assert np.shares_memory(entry[FieldName.TARGET], target)
+    assert entry[FieldName.FEAT_DYNAMIC_REAL].shape == (7, 8)
+    np.testing.assert_array_equal(entry[FieldName.FEAT_STATIC_CAT], stat_cat[1])
+
+    assert [len(entry[FieldName.TARGET]) for entry in dataset] == [10, 10, 10]
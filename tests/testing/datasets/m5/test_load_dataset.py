@@ -0,0 +1,139 @@
+import os
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, List
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from tpk.testing.datasets.m5 import cache, generate_m5_dataset, load_datasets
+from tpk.testing.datasets.m5.cache import _hash_file
+from tpk.testing.datasets.m5.load_dataset import (
+    CONVERTED_PRICE_FILE,
+    convert_price_file,
+    load_m5_arrays,
+    normalize_per_group,
+    read_m5_arrays,
+)
+
+
+def test_normalize_per_group() -> None:
+    rng = np.random.default_rng(42)
+    group_codes = rng.integers(0, 4, size=50).astype(np.int8)
+    values = rng.random((50, 30)) * 10
+    values[rng.random((50, 30)) < 0.3] = np.nan
+    values[group_codes == 1, 3] = np.nan
+
+    df = pd.concat(
+        [pd.DataFrame({"dept_id": group_codes}), pd.DataFrame(values)], axis=1
+    )
+    dept_groups = df.groupby("dept_id")
+    mean = dept_groups.transform("mean")
+    std = dept_groups.transform("std")
+    expected = ((df[mean.columns] - mean) / (std + 1e-6)).values
+
+    actual = normalize_per_group(values, group_codes)
+
+    np.testing.assert_array_equal(np.isnan(actual), np.isnan(expected))
+    np.testing.assert_allclose(actual, expected, rtol=1e-10, atol=1e-12)
+
+
+def test_load_m5_arrays() -> None:
+    with TemporaryDirectory(prefix="m5_") as tmpdir:
+        generate_m5_dataset(tmpdir, scale=0.01)
+
+        built = load_m5_arrays(tmpdir)
+        loaded = load_m5_arrays(tmpdir)
+        expected = read_m5_arrays(tmpdir)
+        for name, value in expected.items():
+            for arrays in [built, loaded]:
+                assert isinstance(arrays[name], np.memmap), name
+                assert arrays[name].dtype == value.dtype, name
+                np.testing.assert_array_equal(arrays[name], value, err_msg=name)
+
+
+def pivot_price_file(data_dir: str) -> Any:
+    # the sell price matrix as built with a merge and pivot_table before
+    calendar = pd.read_csv(f"{data_dir}/calendar.csv")
+    sales_keys = pd.read_csv(
+        f"{data_dir}/sales_train_evaluation.csv", usecols=["store_id", "item_id"]
+    )
+    sell_prices = pd.read_csv(f"{data_dir}/sell_prices.csv")
+
+    price_all_days_items = pd.merge(
+        calendar[["wm_yr_wk", "d"]], sell_prices, on=["wm_yr_wk"], how="left"
+    ).drop(["wm_yr_wk"], axis=1)
+    price_all_items = price_all_days_items.pivot_table(
+        values="sell_price", index=["store_id", "item_id"], columns="d"
+    )
+    price_all_items.reset_index(drop=False, inplace=True)
+    days = [f"d_{i}" for i in range(1, len(calendar) + 1)]
+    price_all_items = price_all_items.reindex(["store_id", "item_id"] + days, axis=1)
+
+    return pd.merge(
+        sales_keys, price_all_items, on=["store_id", "item_id"], how="left"
+    )[days].values
+
+
+def test_convert_price_file(synthetic_m5_dir: str) -> None:
+    expected = pivot_price_file(synthetic_m5_dir)
+    # some items are released after the first week
+    assert np.isnan(expected[:, 0]).any() and not np.isnan(expected[:, -1]).all()
+
+    actual = convert_price_file(synthetic_m5_dir)
+
+    assert actual.shape == expected.shape
+    np.testing.assert_array_equal(np.isnan(actual), np.isnan(expected))
+    np.testing.assert_array_equal(actual, expected)
+    np.testing.assert_array_equal(
+        np.load(f"{synthetic_m5_dir}/{CONVERTED_PRICE_FILE}"), actual
+    )
+
+
+def test_load_datasets_compact(synthetic_m5_dir: str) -> None:
+    _, _, test_ds, cardinalities = load_datasets(synthetic_m5_dir)
+    _, _, compact_test_ds, compact_cardinalities = load_datasets(
+        synthetic_m5_dir, compact=True
+    )
+
+    assert compact_test_ds.target.dtype == np.int16
+    assert compact_test_ds.price_features.dtype == np.float16
+    assert compact_test_ds.calendar_features.dtype == np.int8
+    assert compact_test_ds.stat_cat.dtype.kind == "i"
+    assert compact_cardinalities == cardinalities
+
+    np.testing.assert_array_equal(compact_test_ds.target, test_ds.target)
+    np.testing.assert_array_equal(
+        compact_test_ds.calendar_features, test_ds.calendar_features
+    )
+    np.testing.assert_array_equal(compact_test_ds.stat_cat, test_ds.stat_cat)
+    np.testing.assert_allclose(
+        compact_test_ds.price_features.astype(np.float32),
+        test_ds.price_features,
+        rtol=2**-11,
+        atol=2**-24,
+    )
+
+
+def test_load_datasets_after_touch(
+    synthetic_m5_dir: str, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    load_datasets(synthetic_m5_dir)
+
+    hashed: List[Path] = []
+
+    def hash_file(path: Path) -> str:
+        hashed.append(path)
+        return _hash_file(path)
+
+    monkeypatch.setattr(cache, "_hash_file", hash_file)
+    calendar = Path(synthetic_m5_dir) / "calendar.csv"
+    stat = calendar.stat()
+    os.utime(calendar, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    load_datasets(synthetic_m5_dir)
+    assert hashed == [calendar]
+    hashed.clear()
+    load_datasets(synthetic_m5_dir)
+    assert hashed == []
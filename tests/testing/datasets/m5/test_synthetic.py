@@ -0,0 +1,58 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from tpk.testing.datasets.m5 import (
+    VAL_START,
+    evaluate_wrmsse,
+    generate_m5_dataset,
+    load_datasets,
+    synthetic,
+)
+
+
+def test_generate_m5_dataset(synthetic_m5_dir: str, y_true: Any) -> None:
+    sales = pd.read_csv(Path(synthetic_m5_dir) / "sales_train_evaluation.csv")
+    assert len(sales) == 290
+    assert sales["store_id"].nunique() == 10
+    assert sales["dept_id"].nunique() == 7
+    assert sales.columns[-1] == "d_1941"
+
+    train_ds, val_ds, test_ds, cardinalities = load_datasets(synthetic_m5_dir)
+    assert len(train_ds) == len(sales)
+    assert cardinalities == [29, 7, 3, 10, 3]
+
+    assert evaluate_wrmsse(synthetic_m5_dir, y_true, VAL_START) == 0.0
+    assert evaluate_wrmsse(synthetic_m5_dir, np.zeros_like(y_true), VAL_START) > 0.0
+
+
+def test_generate_m5_dataset_in_blocks(monkeypatch: pytest.MonkeyPatch) -> None:
+    with TemporaryDirectory(prefix="m5_") as tmpdir:
+        generate_m5_dataset(tmpdir, scale=0.01)
+        sales = pd.read_csv(Path(tmpdir) / "sales_train_evaluation.csv")
+
+        # several blocks per store
+        monkeypatch.setattr(synthetic, "ITEM_BLOCK_SIZE", 8)
+        generate_m5_dataset(tmpdir, scale=0.01)
+        block_sales = pd.read_csv(Path(tmpdir) / "sales_train_evaluation.csv")
+        block_prices = pd.read_csv(Path(tmpdir) / "sell_prices.csv")
+
+        pd.testing.assert_frame_equal(block_sales.iloc[:, :6], sales.iloc[:, :6])
+        assert block_sales.columns[-1] == "d_1941"
+        assert set(zip(block_prices["store_id"], block_prices["item_id"])) == set(
+            zip(sales["store_id"], sales["item_id"])
+        )
+        # no sales before an item is listed
+        calendar = pd.read_csv(Path(tmpdir) / "calendar.csv")
+        day_weeks = calendar["wm_yr_wk"].values[: sales.shape[1] - 6]
+        first_week = block_prices.groupby(["store_id", "item_id"])["wm_yr_wk"].min()
+        series_first_week = first_week.loc[
+            list(zip(block_sales["store_id"], block_sales["item_id"]))
+        ].values
+        unlisted = day_weeks[None, :] < series_first_week[:, None]
+        assert unlisted.any()
+        assert np.all(block_sales.iloc[:, 6:].values[unlisted] == 0)
@@ -0,0 +1,37 @@
+from typing import Any
+
+import numpy as np
+import pytest
+
+from tpk.testing.datasets.m5 import (
+    QUANTILES,
+    VAL_START,
+    WSPLEvaluator,
+    get_wrmsse_evaluator,
+)
+
+
+def test_wspl_evaluator(synthetic_m5_dir: str, y_true: Any) -> None:
+    evaluator = get_wrmsse_evaluator(synthetic_m5_dir, VAL_START)
+    wspl_evaluator = WSPLEvaluator(synthetic_m5_dir, VAL_START)
+    quantiles = np.asarray(QUANTILES)
+    rolled_up_y_true = evaluator.roll_mat_csr @ y_true
+    np.testing.assert_array_equal(wspl_evaluator.rolled_up_y_true, rolled_up_y_true)
+    assert (
+        wspl_evaluator.evaluate(np.repeat(rolled_up_y_true[..., None], 9, axis=2))
+        == 0.0
+    )
+
+    # quantiles one above the sales of every aggregate lose (1 - u) per day
+    score, per_level = wspl_evaluator.evaluate(
+        np.repeat(rolled_up_y_true[..., None] + 1.0, 9, axis=2), per_level=True
+    )
+    spl = np.mean(1 - quantiles) / wspl_evaluator.scale
+    np.testing.assert_allclose(score, np.sum(spl * evaluator.w) / 12, rtol=1e-12)
+    np.testing.assert_allclose(per_level.sum() / 12, score, rtol=1e-12)
+
+    # quantiles of the bottom level series do not add up to the aggregates
+    with pytest.raises(ValueError, match="aggregates"):
+        wspl_evaluator.evaluate(np.repeat(y_true[..., None], 9, axis=2))
+    with pytest.raises(ValueError, match="quantiles"):
+        wspl_evaluator.evaluate(rolled_up_y_true[..., None])
@@ -0,0 +1,17 @@
+import numpy as np
+import pytest
+
+from tpk.testing.datasets.m5 import M5Dataset
+
+
+@pytest.fixture
+def m5_dataset() -> M5Dataset:
+    """Small dataset in the compact dtypes of M5, 50 of 60 days exposed."""
+    rng = np.random.default_rng(42)
+    return M5Dataset(
+        target=rng.integers(0, 5, size=(4, 60)).astype(np.int16),
+        price_features=rng.random((4, 2, 60)).astype(np.float16),
+        calendar_features=rng.integers(0, 2, size=(3, 60)).astype(np.int8),
+        stat_cat=rng.integers(0, 4, size=(4, 5)).astype(np.int8),
+        length=50,
+    )
@@ -0,0 +1,106 @@
+from pathlib import Path
+from typing import Any, List
+
+import numpy as np
+import pandas as pd
+import pytest
+from gluonts.evaluation.backtest import make_evaluation_predictions
+from gluonts.torch.distributions import NegativeBinomialOutput
+from lightning.pytorch.loggers import CSVLogger
+
+from tpk.testing.datasets.m5 import (
+    PREDICTION_LENGTH,
+    VAL_START,
+    generate_m5_dataset,
+    get_wrmsse_evaluator,
+    load_datasets,
+)
+from tpk.torch import MyEstimator, TSMixerModel
+from tpk.torch.callbacks import WRMSSE_METRIC
+
+
+class RecordingEvaluator:
+    def __init__(self, evaluator: Any) -> None:
+        self.evaluator = evaluator
+        self.scores: List[float] = []
+
+    def evaluate(self, prediction: Any) -> float:
+        score = self.evaluator.evaluate(prediction)
+        self.scores.append(score)
+        return score  # type: ignore
+
+
+def create_estimator(
+    tmp_path: Path, cardinalities: List[int], epochs: int, **kwargs: Any
+) -> MyEstimator:
+    estimator: MyEstimator = MyEstimator(
+        model_cls=TSMixerModel,
+        freq="D",
+        prediction_length=PREDICTION_LENGTH,
+        context_length=28,
+        n_block=1,
+        hidden_size=16,
+        epochs=epochs,
+        num_feat_dynamic_real=7,
+        num_feat_static_cat=5,
+        cardinality=cardinalities,
+        distr_output=NegativeBinomialOutput(),
+        batch_size=32,
+        num_batches_per_epoch=2,
+        num_workers=0,
+        trainer_kwargs={
+            "max_epochs": epochs,
+            "logger": CSVLogger(tmp_path),
+            "default_root_dir": tmp_path,
+            "enable_progress_bar": False,
+        },
+        **kwargs,
+    )
+    return estimator
+
+
+def test_wrmsse_callback(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # the best checkpoint holds the hyperparameters of the network, which
+    # torch>=2.6 does not load by default
+    monkeypatch.setenv("TORCH_FORCE_NO_WEIGHTS_ONLY_LOAD", "1")
+
+    data_dir = tmp_path / "m5"
+    generate_m5_dataset(data_dir, scale=0.01)
+    train_ds, val_ds, _, cardinalities = load_datasets(str(data_dir))
+    evaluator = get_wrmsse_evaluator(str(data_dir), VAL_START)
+    recording_evaluator = RecordingEvaluator(evaluator)
+
+    estimator = create_estimator(
+        tmp_path / "wrmsse",
+        cardinalities,
+        epochs=4,
+        validation_evaluator=recording_evaluator,
+        validation_every_n_epochs=2,
+    )
+    output = estimator.train_model(train_ds, validation_data=val_ds)
+    assert output.trainer.checkpoint_callback.monitor == WRMSSE_METRIC
+
+    # logged in every second epoch only, without the sanity check
+    metrics = pd.read_csv(Path(output.trainer.logger.log_dir) / "metrics.csv")
+    logged = metrics[metrics[WRMSSE_METRIC].notna()]
+    assert logged["epoch"].tolist() == [1, 3]
+    np.testing.assert_allclose(
+        logged[WRMSSE_METRIC], recording_evaluator.scores, rtol=1e-6
+    )
+
+    # the last score is the one of the forecast means of the final network
+    predictor = estimator.create_predictor(
+        output.transformation, output.trainer.lightning_module
+    )
+    forecast_it, _ = make_evaluation_predictions(dataset=val_ds, predictor=predictor)
+    means = np.stack([forecast.mean for forecast in forecast_it])
+    np.testing.assert_allclose(
+        recording_evaluator.scores[-1], evaluator.evaluate(means), rtol=1e-5
+    )
+
+    # without an evaluator checkpoints are selected by the validation loss
+    estimator = create_estimator(tmp_path / "loss", cardinalities, epochs=1)
+    output = estimator.train_model(train_ds, validation_data=val_ds)
+    assert output.trainer.checkpoint_callback.monitor == "val_loss"
+    metrics = pd.read_csv(Path(output.trainer.logger.log_dir) / "metrics.csv")
+    assert WRMSSE_METRIC not in metrics
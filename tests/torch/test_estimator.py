@@ -0,0 +1,251 @@
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+import torch
+from gluonts.dataset.common import Dataset
+from gluonts.evaluation.backtest import make_evaluation_predictions
+from gluonts.itertools import Cached
+from gluonts.torch.distributions import NegativeBinomialOutput
+from gluonts.transform import SetField
+from torch.utils.data import DataLoader
+
+from tpk.testing.datasets.m5 import M5Dataset
+from tpk.torch import MyEstimator, TSMixerModel
+from tpk.torch.batch_sampler import DeviceWindowSampler, WindowBatchSampler
+from tpk.torch.estimator import (
+    PREDICTION_INPUT_NAMES,
+    TRAINING_INPUT_NAMES,
+    ArenaCollate,
+    ShardedIterableDataset,
+    collate_as_float32,
+    shard_dataset,
+)
+
+
+def first_entries(data: Dataset) -> Iterable[Dict[str, Any]]:
+    for entry in data:
+        yield {"item_id": entry["item_id"], "sample": np.random.randint(2**31)}
+
+
+def test_shard_dataset() -> None:
+    entries: List[Dict[str, Any]] = [{"item_id": i} for i in range(10)]
+    transformed = SetField(output_field="x", value=1).apply(entries)
+
+    for data in [entries, transformed, Cached(transformed)]:
+        shards = [shard_dataset(data, index, 3) for index in range(3)]
+        assert [len(shard) for shard in shards] == [4, 3, 3]
+        item_ids = [entry["item_id"] for shard in shards for entry in shard]
+        assert sorted(item_ids) == list(range(10))
+
+
+def test_sharded_iterable_dataset() -> None:
+    entries = [{"item_id": i} for i in range(20)]
+
+    data_loader = DataLoader(
+        ShardedIterableDataset(entries, first_entries),
+        batch_size=None,
+        num_workers=2,
+    )
+    instances = list(data_loader)
+
+    # every series once, with different random states in the workers
+    assert sorted(instance["item_id"] for instance in instances) == list(range(20))
+    samples = {instance["item_id"]: int(instance["sample"]) for instance in instances}
+    assert len(set(samples.values())) == 20
+
+    # all series in the main process
+    assert len(list(ShardedIterableDataset(entries, first_entries))) == 20
+
+
+def test_window_batch_sampler(m5_dataset: M5Dataset) -> None:
+    data = m5_dataset
+    estimator = MyEstimator(
+        model_cls=TSMixerModel,
+        freq="D",
+        prediction_length=7,
+        context_length=10,
+        epochs=1,
+        num_feat_dynamic_real=5,
+        num_feat_static_cat=5,
+        cardinality=[4] * 5,
+        distr_output=NegativeBinomialOutput(),
+        batch_size=6,
+        num_batches_per_epoch=3,
+        num_workers=0,
+        use_array_sampler=True,
+    )
+    sampler = WindowBatchSampler(
+        data,
+        past_length=10,
+        future_length=7,
+        batch_size=6,
+        time_features=estimator.time_features,
+    )
+
+    entries = list(estimator.create_transformation().apply(data, is_train=True))
+    splitter = estimator._create_instance_splitter(None, "training")
+    series = np.array([0, 1, 2, 3, 0, 1])
+    split_points = np.array([0, 3, 10, 25, 43, 43])
+    batch = sampler.gather_batch(series, split_points)
+    for k, (i, split_point) in enumerate(zip(series, split_points)):
+        expected = splitter._split_instance(entries[i], split_point)
+        for name in TRAINING_INPUT_NAMES:
+            np.testing.assert_array_equal(
+                batch[name][k].numpy(), expected[name], err_msg=name
+            )
+
+    data_loader = estimator.create_training_data_loader(data, None)
+    batches = list(data_loader)
+    assert len(batches) == 3
+    assert batches[0]["past_time_feat"].shape == (
+        6,
+        10,
+        len(estimator.time_features) + 5,
+    )
+    assert batches[0]["future_target"].shape == (6, 7)
+
+
+def test_device_window_sampler(m5_dataset: M5Dataset) -> None:
+    data = m5_dataset
+    estimator = MyEstimator(
+        model_cls=TSMixerModel,
+        freq="D",
+        prediction_length=7,
+        context_length=10,
+        epochs=1,
+        num_feat_dynamic_real=5,
+        num_feat_static_cat=5,
+        cardinality=[4] * 5,
+        distr_output=NegativeBinomialOutput(),
+        batch_size=6,
+        num_batches_per_epoch=3,
+        device_resident=True,
+    )
+    sampler = DeviceWindowSampler(
+        data,
+        past_length=10,
+        future_length=7,
+        batch_size=6,
+        time_features=estimator.time_features,
+    )
+
+    entries = list(estimator.create_transformation().apply(data, is_train=True))
+    splitter = estimator._create_instance_splitter(None, "training")
+    series = np.array([0, 1, 2, 3, 0, 1])
+    split_points = np.array([0, 3, 10, 25, 43, 43])
+    batch = sampler.gather_batch(
+        torch.from_numpy(series), torch.from_numpy(split_points)
+    )
+    for k, (i, split_point) in enumerate(zip(series, split_points)):
+        expected = splitter._split_instance(entries[i], split_point)
+        for name in TRAINING_INPUT_NAMES:
+            np.testing.assert_array_equal(
+                batch[name][k].numpy(), expected[name], err_msg=name
+            )
+
+    batches = list(estimator.create_training_data_loader(data, None))
+    assert len(batches) == 3
+    assert batches[0]["past_time_feat"].shape == (
+        6,
+        10,
+        len(estimator.time_features) + 5,
+    )
+    assert batches[0]["future_target"].shape == (6, 7)
+
+
+def test_arena_collate() -> None:
+    rng = np.random.default_rng(0)
+    instances = [
+        {
+            "feat_static_cat": rng.integers(0, 5, size=2),
+            "past_target": rng.integers(0, 9, size=6).astype(np.int16),
+            "past_time_feat": rng.random((6, 3)).astype(np.float32),
+        }
+        for _ in range(10)
+    ]
+    collate = ArenaCollate(
+        shapes={
+            "feat_static_cat": (4, 2),
+            "past_target": (4, 6),
+            "past_time_feat": (4, 6, 3),
+        },
+        dtypes={
+            "feat_static_cat": torch.long,
+            "past_target": torch.float,
+            "past_time_feat": torch.float,
+        },
+        num_buffers=2,
+    )
+
+    batches = [collate(instances[i : i + 4]) for i in range(0, 10, 4)]
+    assert batches[2]["past_target"].shape == (2, 6)
+    expected = collate_as_float32(instances[8:])
+    for name, value in batches[2].items():
+        assert value.dtype == expected[name].dtype
+        torch.testing.assert_close(value, expected[name])
+
+    # the third batch is written to the buffers of the first one
+    assert (
+        batches[2]["past_time_feat"].data_ptr()
+        == batches[0]["past_time_feat"].data_ptr()
+    )
+    assert (
+        batches[1]["past_time_feat"].data_ptr()
+        != batches[0]["past_time_feat"].data_ptr()
+    )
+
+
+def test_compact_dtypes(m5_dataset: M5Dataset) -> None:
+    data = m5_dataset
+    estimator = MyEstimator(
+        model_cls=TSMixerModel,
+        freq="D",
+        prediction_length=7,
+        context_length=10,
+        epochs=1,
+        num_feat_dynamic_real=5,
+        num_feat_static_cat=5,
+        cardinality=[4] * 5,
+        distr_output=NegativeBinomialOutput(),
+        batch_size=6,
+        num_batches_per_epoch=1,
+        num_workers=0,
+        compact_dtypes=True,
+    )
+    transformation = estimator.create_transformation()
+    entry = next(iter(transformation.apply(data, is_train=True)))
+    assert entry["target"].dtype == np.int16
+
+    module = estimator.create_lightning_module()
+    input_dtypes: Dict[str, torch.dtype] = {}
+
+    def record_dtypes(model: Any, args: Any, kwargs: Dict[str, Any]) -> None:
+        # the predictor passes the inputs as positional arguments
+        inputs = {**dict(zip(PREDICTION_INPUT_NAMES, args)), **kwargs}
+        input_dtypes.update({name: value.dtype for name, value in inputs.items()})
+
+    module.model.register_forward_pre_hook(record_dtypes, with_kwargs=True)
+
+    # training batches
+    batch = next(
+        iter(
+            estimator.create_training_data_loader(
+                transformation.apply(data, is_train=True), module
+            )
+        )
+    )
+    for name in TRAINING_INPUT_NAMES:
+        assert batch[name].dtype == (
+            torch.long if name == "feat_static_cat" else torch.float32
+        ), name
+    module._compute_loss(batch)
+    assert input_dtypes["past_target"] == torch.float32
+    assert input_dtypes["past_time_feat"] == torch.float32
+
+    # prediction batches
+    input_dtypes.clear()
+    predictor = estimator.create_predictor(transformation, module)
+    forecast_it, _ = make_evaluation_predictions(dataset=data, predictor=predictor)
+    assert len(list(forecast_it)) == len(data)
+    assert input_dtypes["past_target"] == torch.float32
+    assert input_dtypes["past_time_feat"] == torch.float32
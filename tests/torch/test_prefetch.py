@@ -0,0 +1,103 @@
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+import lightning.pytorch as pl
+import pytest
+import torch
+from gluonts.torch.distributions import NegativeBinomialOutput
+
+from tpk.testing.datasets.m5 import M5Dataset
+from tpk.torch import MyEstimator, TSMixerModel
+from tpk.torch.prefetch import BatchPrefetcher
+
+
+def batches(n: int, delay: float = 0.0) -> Iterator[Dict[str, torch.Tensor]]:
+    for i in range(n):
+        time.sleep(delay)
+        yield {
+            "past_target": torch.full((4, 3), float(i)),
+            "feat_static_cat": torch.full((4, 1), i),
+        }
+
+
+def test_batch_prefetcher() -> None:
+    prefetcher = BatchPrefetcher(batches(10), num_prefetch=2, num_in_use=2)
+
+    in_use: List[Tuple[int, Dict[str, torch.Tensor]]] = []
+    for i, batch in enumerate(prefetcher):
+        in_use = (in_use + [(i, batch)])[-2:]
+        for j, used in in_use:
+            assert torch.all(used["past_target"] == j)
+            assert used["feat_static_cat"].dtype == torch.int64
+    assert i == 9
+    assert prefetcher.num_batches == 10
+
+    # the buffers are reused
+    assert len({id(buffer) for buffer in prefetcher.buffers}) == 5
+    with pytest.raises(StopIteration):
+        next(prefetcher)
+
+
+def test_batch_prefetcher_waits() -> None:
+    prefetcher = BatchPrefetcher(batches(3, delay=0.05))
+    assert len(list(prefetcher)) == 3
+    assert prefetcher.num_waits == 3
+    assert prefetcher.wait_time > 0.1
+
+    def failing() -> Iterator[Dict[str, torch.Tensor]]:
+        yield from batches(1)
+        raise ValueError("failed")
+
+    prefetcher = BatchPrefetcher(failing())
+    next(prefetcher)
+    with pytest.raises(ValueError):
+        next(prefetcher)
+    prefetcher.close()
+
+
+class FailingCallback(pl.Callback):
+    def on_train_batch_end(self, *args: Any) -> None:
+        raise RuntimeError("interrupted")
+
+
+def test_prefetcher_closed_on_failure(
+    tmp_path: Path, m5_dataset: M5Dataset, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    estimator = MyEstimator(
+        model_cls=TSMixerModel,
+        freq="D",
+        prediction_length=7,
+        context_length=10,
+        epochs=1,
+        num_feat_dynamic_real=5,
+        num_feat_static_cat=5,
+        cardinality=[4] * 5,
+        distr_output=NegativeBinomialOutput(),
+        batch_size=6,
+        num_batches_per_epoch=3,
+        num_workers=0,
+        use_array_sampler=True,
+        prefetch_batches=2,
+        trainer_kwargs={
+            "max_epochs": 1,
+            "callbacks": [FailingCallback()],
+            "logger": False,
+            "default_root_dir": tmp_path,
+            "enable_progress_bar": False,
+        },
+    )
+    prefetchers: List[Any] = []
+    prefetch = estimator._prefetch
+
+    def record_prefetcher(batches: Iterator[Any]) -> Iterator[Any]:
+        prefetchers.append(prefetch(batches))
+        return prefetchers[-1]  # type: ignore
+
+    monkeypatch.setattr(estimator, "_prefetch", record_prefetcher)
+
+    with pytest.raises(RuntimeError, match="interrupted"):
+        estimator.train_model(m5_dataset)
+    assert isinstance(prefetchers[0], BatchPrefetcher)
+    assert prefetchers[0].thread is not None
+    assert not prefetchers[0].thread.is_alive()
@@ -0,0 +1,65 @@
+from typing import Any, Dict
+
+import numpy as np
+import pandas as pd
+import pytest
+from gluonts.dataset.field_names import FieldName
+from gluonts.exceptions import GluonTSDataError
+from gluonts.time_feature import time_features_from_frequency_str
+from gluonts.transform import AddTimeFeatures
+
+from tpk.torch.transform import AddSharedTimeFeatures, AsCompactNumpyArray
+
+
+def test_as_compact_numpy_array() -> None:
+    transformation = AsCompactNumpyArray(field=FieldName.TARGET, expected_ndim=1)
+
+    for dtype in [np.int16, np.float16, np.float32]:
+        entry = {FieldName.TARGET: np.arange(5, dtype=dtype)}
+        target = transformation.transform(entry)[FieldName.TARGET]
+        assert target.dtype == dtype
+
+    target = transformation.transform({FieldName.TARGET: [1, 2, 3]})[FieldName.TARGET]
+    assert target.dtype == np.float32
+    np.testing.assert_array_equal(target, [1, 2, 3])
+
+    with pytest.raises(GluonTSDataError):
+        transformation.transform({FieldName.TARGET: np.zeros((2, 3), dtype=np.int16)})
+
+
+def test_add_shared_time_features() -> None:
+    kwargs: Dict[str, Any] = {
+        "start_field": FieldName.START,
+        "target_field": FieldName.TARGET,
+        "output_field": FieldName.FEAT_TIME,
+        "time_features": time_features_from_frequency_str("D"),
+        "pred_length": 7,
+    }
+    shared = AddSharedTimeFeatures(**kwargs)
+    expected = AddTimeFeatures(**kwargs)
+
+    entries = [
+        {
+            FieldName.START: pd.Period(start, freq="D"),
+            FieldName.TARGET: np.zeros(length, dtype=np.float32),
+        }
+        for start, length in [
+            ("2011-01-29", 30),
+            ("2011-01-29", 50),
+            ("2011-01-29", 40),
+            ("2012-03-01", 40),
+        ]
+    ]
+
+    for is_train in [True, False]:
+        outputs = [
+            shared.map_transform(entry.copy(), is_train)[FieldName.FEAT_TIME]
+            for entry in entries
+        ]
+        for entry, output in zip(entries, outputs):
+            np.testing.assert_array_equal(
+                output,
+                expected.map_transform(entry.copy(), is_train)[FieldName.FEAT_TIME],
+            )
+        assert np.shares_memory(outputs[1], outputs[2])
+        assert not np.shares_memory(outputs[2], outputs[3])
@@ -0,0 +1,81 @@
+import json
+import pickle
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+from gluonts.torch.distributions import NegativeBinomialOutput
+
+from tpk.testing.datasets.m5 import M5Dataset
+from tpk.torch import MyEstimator, TSMixerModel, transform_cache
+from tpk.torch.transform_cache import (
+    METADATA_FILE,
+    cached_transformation,
+    transformation_key,
+)
+
+
+def test_cached_transformation(
+    tmp_path: Path, m5_dataset: M5Dataset, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    data = m5_dataset
+    estimator = MyEstimator(
+        model_cls=TSMixerModel,
+        freq="D",
+        prediction_length=7,
+        epochs=1,
+        num_feat_dynamic_real=5,
+        num_feat_static_cat=5,
+        cardinality=[4] * 5,
+        distr_output=NegativeBinomialOutput(),
+    )
+    transformation = estimator.create_transformation()
+
+    cached = cached_transformation(str(tmp_path), transformation, data)
+    expected = list(transformation.apply(data, is_train=True))
+    assert len(cached) == len(expected)
+    for entry, expected_entry in zip(pickle.loads(pickle.dumps(cached)), expected):
+        assert entry.keys() == expected_entry.keys()
+        for name, value in expected_entry.items():
+            if isinstance(value, np.ndarray):
+                assert entry[name].dtype == value.dtype
+                np.testing.assert_array_equal(entry[name], value, err_msg=name)
+            else:
+                assert entry[name] == value
+
+    # later calls map the same files
+    key = transformation_key(transformation, data, is_train=True)
+    assert [path.name for path in tmp_path.iterdir() if path.is_dir()] == [key]
+    mtime = (tmp_path / key / "metadata.json").stat().st_mtime_ns
+    assert len(list(cached_transformation(str(tmp_path), transformation, data))) == 4
+    assert (tmp_path / key / "metadata.json").stat().st_mtime_ns == mtime
+
+    # other versions, data, transformations or modes get other keys
+    monkeypatch.setattr(transform_cache, "CACHE_FORMAT_VERSION", 0)
+    assert transformation_key(transformation, data, is_train=True) != key
+    monkeypatch.undo()
+    estimator.compact_dtypes = True
+    assert (
+        len(
+            {
+                key,
+                transformation_key(transformation, data.with_length(40), is_train=True),
+                transformation_key(transformation, data, is_train=False),
+                transformation_key(
+                    estimator.create_transformation(), data, is_train=True
+                ),
+            }
+        )
+        == 4
+    )
+
+    # writing a new cache removes the caches of other versions only
+    stale = tmp_path / "stale"
+    shutil.copytree(tmp_path / key, stale)
+    metadata = json.loads((stale / METADATA_FILE).read_text())
+    (stale / METADATA_FILE).write_text(json.dumps({**metadata, "versions": "0"}))
+    cached_transformation(str(tmp_path), transformation, data.with_length(40))
+    assert sorted(path.name for path in tmp_path.iterdir() if path.is_dir()) == sorted(
+        [key, transformation_key(transformation, data.with_length(40), is_train=True)]
+    )
@@ -50,6 +50,51 @@ def train_model(
     use_one_cycle: Annotated[
         bool, typer.Option(help="Whether to use one cycle leraning rate shcedule")
     ] = False,
+    compact_dtypes: Annotated[
+        bool, typer.Option(help="Load the dataset using compact dtypes")
+    ] = False,
+    wrmsse_every_n_epochs: Annotated[
+        int,
+        typer.Option(
+            help="Compute the validation WRMSSE every n epochs during training and use it to select the best checkpoint (0 to disable)"
+        ),
+    ] = 0,
+    num_workers: Annotated[
+        int,
+        typer.Option(
+            help="Number of data loader workers, each sampling from its own shard of the series (0 to load in the main process)"
+        ),
+    ] = 2,
+    use_array_sampler: Annotated[
+        bool,
+        typer.Option(
+            help="Draw the training windows of whole batches directly from the dataset arrays"
+        ),
+    ] = False,
+    device_resident: Annotated[
+        bool,
+        typer.Option(
+            help="Keep the training series on the training device and slice the training windows there"
+        ),
+    ] = False,
+    prefetch_batches: Annotated[
+        int,
+        typer.Option(
+            help="Number of training batches prepared ahead by a background thread (0 to disable)"
+        ),
+    ] = 0,
+    reuse_batch_buffers: Annotated[
+        bool,
+        typer.Option(
+            help="Collate the training and validation batches into reused buffers"
+        ),
+    ] = False,
+    transformation_cache_dir: Annotated[
+        Optional[str],
+        typer.Option(
+            help="Directory caching the transformed training and validation data between runs, with a copy per transformation and dataset"
+        ),
+    ] = None,
 ) -> None:
     from tpk.hypervalidation import train_model as concrete_train_model
 
@@ -67,6 +112,14 @@ def train_model(
         use_static_feat=use_static_feat,
         lr=lr,
         use_one_cycle=use_one_cycle,
+        compact_dtypes=compact_dtypes,
+        wrmsse_every_n_epochs=wrmsse_every_n_epochs,
+        num_workers=num_workers,
+        use_array_sampler=use_array_sampler,
+        device_resident=device_resident,
+        prefetch_batches=prefetch_batches,
+        reuse_batch_buffers=reuse_batch_buffers,
+        transformation_cache_dir=transformation_cache_dir,
     )
 
     typer.echo(validation_wrmsse)
@@ -135,6 +188,9 @@ def find_lr(
         bool, typer.Option(help="Disable future features")
     ] = False,
     use_static_feat: Annotated[bool, typer.Option(help="Use static features")] = True,
+    compact_dtypes: Annotated[
+        bool, typer.Option(help="Load the dataset using compact dtypes")
+    ] = False,
 ) -> None:
     from tpk.hypervalidation import find_lr as concrete_find_lr
 
@@ -151,6 +207,24 @@ def find_lr(
         disable_future_feature=disable_future_feat,
         use_static_feat=use_static_feat,
         lr=0.0,
+        compact_dtypes=compact_dtypes,
     )
 
     typer.echo(lr)
+
+
+@app.command()
+def generate_m5_dataset(
+    data_path: Annotated[
+        str, typer.Option(help="Path to write the dataset to")
+    ] = "data/m5_synthetic",
+    scale: Annotated[
+        float, typer.Option(help="Number of series relative to the M5 dataset")
+    ] = 1.0,
+    seed: Annotated[int, typer.Option(help="Seed of the random generator")] = 0,
+) -> None:
+    from tpk.testing.datasets.m5 import generate_m5_dataset as concrete_generate
+
+    concrete_generate(data_path=data_path, scale=scale, seed=seed)
+
+    typer.echo(f"Synthetic M5 dataset written to {data_path}")
@@ -1,4 +1,4 @@
-from typing import Any, Type, Union
+from typing import Any, Optional, Type, Union
 
 import numpy as np
 from gluonts.evaluation.backtest import make_evaluation_predictions
@@ -11,7 +11,8 @@ from tpk.testing.datasets.m5 import (
     N_TS,
     PREDICTION_LENGTH,
     VAL_START,
-    evaluate_wrmsse,
+    WRMSSEAccumulator,
+    get_wrmsse_evaluator,
     load_datasets,
 )
 from tpk.torch import MyEstimator, TPKModel, TSMixerModel
@@ -27,16 +28,14 @@ def evaluate(
         dataset=dataset, predictor=predictor, num_samples=100
     )
 
-    forecasts = list(tqdm(forecast_it, total=len(dataset)))
-
-    forecasts_acc = np.zeros((len(forecasts), PREDICTION_LENGTH))
-    if isinstance(forecasts[0], (PTDistributionForecast, QuantileForecast)):
-        for i in range(len(forecasts)):
-            forecasts_acc[i] = forecasts[i].mean
-    else:
-        for i in range(len(forecasts)):
-            forecasts_acc[i] = np.mean(forecasts[i].samples, axis=0)
-    wrmsse = evaluate_wrmsse(data_dir, forecasts_acc, prediction_start, score_only=True)
+    evaluator = get_wrmsse_evaluator(data_dir, prediction_start)
+    accumulator = WRMSSEAccumulator(evaluator)
+    for forecast in tqdm(forecast_it, total=len(dataset)):
+        if isinstance(forecast, (PTDistributionForecast, QuantileForecast)):
+            accumulator.update(forecast.mean)
+        else:
+            accumulator.update(np.mean(forecast.samples, axis=0))
+    wrmsse = accumulator.score(score_only=True)
     return wrmsse
 
 
@@ -55,8 +54,18 @@ def train_model(
     use_static_feat: bool,
     lr: float,
     use_one_cycle: bool,
+    compact_dtypes: bool = False,
+    wrmsse_every_n_epochs: int = 0,
+    num_workers: int = 2,
+    use_array_sampler: bool = False,
+    device_resident: bool = False,
+    prefetch_batches: int = 0,
+    reuse_batch_buffers: bool = False,
+    transformation_cache_dir: Optional[str] = None,
 ) -> float:
-    train_ds, val_ds, _, stat_cat_cardinalities = load_datasets(data_path)
+    train_ds, val_ds, _, stat_cat_cardinalities = load_datasets(
+        data_path, compact=compact_dtypes
+    )
     estimator = MyEstimator(
         model_cls=model_cls,
         prediction_length=PREDICTION_LENGTH,
@@ -82,9 +91,22 @@ def train_model(
             "callbacks": [],
         },
         use_one_cycle=use_one_cycle,
+        compact_dtypes=compact_dtypes,
+        validation_evaluator=(
+            get_wrmsse_evaluator(data_path, VAL_START)
+            if wrmsse_every_n_epochs > 0
+            else None
+        ),
+        validation_every_n_epochs=max(1, wrmsse_every_n_epochs),
+        num_workers=num_workers,
+        use_array_sampler=use_array_sampler,
+        device_resident=device_resident,
+        prefetch_batches=prefetch_batches,
+        reuse_batch_buffers=reuse_batch_buffers,
+        transformation_cache_dir=transformation_cache_dir,
     )
 
-    predictor = estimator.train(train_ds, validation_data=val_ds, num_workers=32)
+    predictor = estimator.train(train_ds, validation_data=val_ds)
 
     val_wrmsse = evaluate(data_path, val_ds, predictor, VAL_START)
     return val_wrmsse  # type: ignore
@@ -104,8 +126,11 @@ def find_lr(
     disable_future_feature: bool,
     use_static_feat: bool,
     lr: float,
+    compact_dtypes: bool = False,
 ) -> float:
-    train_ds, _, _, stat_cat_cardinalities = load_datasets(data_path)
+    train_ds, _, _, stat_cat_cardinalities = load_datasets(
+        data_path, compact=compact_dtypes
+    )
     estimator = MyEstimator(
         model_cls=model_cls,
         prediction_length=PREDICTION_LENGTH,
@@ -130,6 +155,7 @@ def find_lr(
             "max_epochs": epochs,
             "callbacks": [],
         },
+        compact_dtypes=compact_dtypes,
     )
 
     return estimator.find_lr(train_ds)  # type: ignore
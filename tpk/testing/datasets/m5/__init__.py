@@ -1,4 +1,11 @@
-from .accuracy_evaluator import evaluate_wrmsse
+from .accuracy_evaluator import (
+    WRMSSEAccumulator,
+    WRMSSEBacktestEvaluator,
+    WRMSSEEvaluator,
+    evaluate_wrmsse,
+    get_wrmsse_evaluator,
+)
+from .dataset import M5Dataset
 from .load_dataset import (
     N_TS,
     PREDICTION_LENGTH,
@@ -6,10 +13,20 @@ from .load_dataset import (
     VAL_START,
     load_datasets,
 )
+from .synthetic import generate_m5_dataset
+from .uncertainty_evaluator import QUANTILES, WSPLEvaluator
 
 __all__ = [
     "load_datasets",
+    "M5Dataset",
+    "generate_m5_dataset",
     "evaluate_wrmsse",
+    "get_wrmsse_evaluator",
+    "WRMSSEEvaluator",
+    "WRMSSEAccumulator",
+    "WRMSSEBacktestEvaluator",
+    "WSPLEvaluator",
+    "QUANTILES",
     "N_TS",
     "PREDICTION_LENGTH",
     "TEST_START",
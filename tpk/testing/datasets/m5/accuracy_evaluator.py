@@ -1,13 +1,36 @@
-import gc
 import os
-from typing import Any, Tuple
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Tuple
 
 import numpy as np
 import pandas as pd
-from scipy.sparse import csr_matrix
+from scipy.sparse import csr_matrix, load_npz, save_npz
+
+from tpk.utils.cache import artifact_lock, atomic_path
+
+from .cache import ensure_artifact, is_artifact_fresh, record_artifact
 
 prediction_length = 28
 
+# memory used per chunk of days when calculating the S weights, in bytes
+S_MEMORY_BUDGET = 256 * 2**20
+
+ROLL_MAT_FILE = "ordered_roll_mat.npz"
+ROLL_INDEX_FILES = {"level": "ordered_roll_level.npy", "id": "ordered_roll_id.npy"}
+ROLL_MAT_OUTPUTS = [ROLL_MAT_FILE] + list(ROLL_INDEX_FILES.values())
+# the rollup matrix depends only on the hierarchy of the sales file, the
+# weights also on the sales and prices of the days before the prediction
+ROLL_MAT_SOURCES = ["sales_train_evaluation.csv"]
+SW_SOURCES = ["calendar.csv", "sales_train_evaluation.csv", "sell_prices.csv"]
+
+
+def sw_file(prediction_start: int) -> str:
+    return f"ordered_sw_p{prediction_start}.npy"
+
+
+# S, W and SW of all origins of the backtest, indexed by prediction start
+SW_BACKTEST_FILE = "ordered_sw_backtest.npz"
+
 
 # Memory reduction helper function:
 def reduce_mem_usage(df: pd.DataFrame, verbose: bool = True) -> pd.DataFrame:
@@ -50,22 +73,85 @@ def reduce_mem_usage(df: pd.DataFrame, verbose: bool = True) -> pd.DataFrame:
     return df
 
 
-# Fucntion to calculate S weights:
-def get_s(roll_mat_csr: csr_matrix, sales: pd.DataFrame, prediction_start: int) -> Any:
-    # Rollup sales:
-    d_name = ["d_" + str(i) for i in range(1, prediction_start)]
-    sales_train_val = roll_mat_csr * sales[d_name].values
-
-    no_sales = np.cumsum(sales_train_val, axis=1) == 0
+# Fucntion to calculate S weights of several forecast origins:
+def get_s_origins(
+    roll_mat_csr: csr_matrix,
+    sales: pd.DataFrame,
+    prediction_starts: Sequence[int],
+    memory_budget: int = S_MEMORY_BUDGET,
+    squared: bool = True,
+) -> Any:
+    """
+    Calculates the denominator of the RMSSE of every aggregate: the mean
+    squared daily difference of its rolled up sales, from its first sale on,
+    over the days before each of ``prediction_starts``. If ``squared`` is not
+    set, the mean absolute daily difference is calculated instead, i.e. the
+    scale of the SPL.
+
+    All origins are calculated in one pass over the days, which are processed
+    in chunks, so the rolled up sales of all days are never held in memory at
+    once; ``memory_budget`` bounds the memory (in bytes) used per chunk.
+    Returns an array of size (origins, aggregates).
+    """
+    n_aggregates, n_series = roll_mat_csr.shape
+    d_name = ["d_" + str(i) for i in range(1, max(prediction_starts))]
+    # sales, rolled up sales and three temporaries of the same size per day
+    chunk_days = max(2, memory_budget // (8 * (n_series + 4 * n_aggregates)))
+    # chunks end at every origin
+    origin_ends = {start - 1 for start in prediction_starts}
+    chunk_ends = sorted(
+        origin_ends | set(range(chunk_days, len(d_name), chunk_days)) | {len(d_name)}
+    )
 
-    # Denominator of RMSSE / RMSSE
-    diff = np.diff(sales_train_val, axis=1)
-    diff = np.where(no_sales[:, 1:], np.nan, diff)
+    total_sales = np.zeros(n_aggregates)
+    sum_squares = np.zeros(n_aggregates)
+    n_days = np.zeros(n_aggregates)
+    last_day: Any = None
+    weights = {}
+    for start, end in zip([0] + chunk_ends[:-1], chunk_ends):
+        # Rollup sales:
+        sales_train_val = roll_mat_csr * sales[d_name[start:end]].values
+
+        cumulative_sales = total_sales[:, None] + np.cumsum(sales_train_val, axis=1)
+        total_sales = cumulative_sales[:, -1]
+
+        # differences to the previous day, the first day has none
+        if last_day is None:
+            diff = np.diff(sales_train_val, axis=1)
+            cumulative_sales = cumulative_sales[:, 1:]
+        else:
+            diff = np.diff(sales_train_val, axis=1, prepend=last_day[:, None])
+        last_day = sales_train_val[:, -1]
+
+        # Denominator of RMSSE / RMSSE, days before the first sale are skipped
+        sold = cumulative_sales != 0
+        if squared:
+            sum_squares += np.einsum("ad,ad->a", np.where(sold, diff, 0), diff)
+        else:
+            sum_squares += np.where(sold, np.abs(diff), 0).sum(axis=1)
+        n_days += sold.sum(axis=1)
+
+        if end in origin_ends:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                weight1 = sum_squares / n_days
+            weight1[n_days == 0] = 1e-9
+            weights[end + 1] = weight1
+
+    return np.stack([weights[start] for start in prediction_starts])
 
-    weight1 = np.nanmean(diff**2, axis=1)
-    weight1[np.isnan(weight1)] = 1e-9
 
-    return weight1
+# Fucntion to calculate S weights:
+def get_s(
+    roll_mat_csr: csr_matrix,
+    sales: pd.DataFrame,
+    prediction_start: int,
+    memory_budget: int = S_MEMORY_BUDGET,
+) -> Any:
+    """
+    Calculates the denominator of the RMSSE of every aggregate over the days
+    before ``prediction_start``, see ``get_s_origins``.
+    """
+    return get_s_origins(roll_mat_csr, sales, [prediction_start], memory_budget)[0]
 
 
 # Functinon to calculate weights:
@@ -93,67 +179,184 @@ def rollup(roll_mat_csr: csr_matrix, v: Any) -> Any:
     return roll_mat_csr * v  # (v.T*roll_mat_csr.T).T
 
 
+# Number of aggregates of every level of the original M5 data:
+AGGREGATION_COUNT = [1, 3, 10, 3, 7, 9, 21, 30, 70, 3049, 9147, 30490]
+
+
 # Function to calculate WRMSSE:
 def wrmsse(
-    error: float, score_only: bool, roll_mat_csr: csr_matrix, s: Any, w: Any, sw: Any
+    error: float,
+    score_only: bool,
+    roll_mat_csr: csr_matrix,
+    s: Any,
+    w: Any,
+    sw: Any,
+    level_offsets: Any = None,
+    return_raw: bool = True,
 ) -> Any:
     """
     preds - Predictions: pd.DataFrame of size (30490 rows, N day columns)
     y_true - True values: pd.DataFrame of size (30490 rows, N day columns)
     sequence_length - np.array of size (42840,)
     sales_weight - sales weights based on last 28 days: np.array (42840,)
+    level_offsets - first row of every aggregation level in the rollup matrix,
+        by default the offsets of the original M5 data
+    return_raw - whether to return the score matrix, otherwise None is
+        returned in its place
     """
+    # float, so that the buffer can be reused for the weighted errors below
+    rolled_up = rollup(roll_mat_csr, error).astype(np.float64, copy=False)
+    n_days = rolled_up.shape[1]
 
+    # weighted RMSSE of every aggregate
+    squared_error = np.einsum("ad,ad->a", rolled_up, rolled_up)
+    wrmsse_i = np.sqrt(squared_error / n_days) * sw
+
+    # score == aggregated_wrmsse.mean()
+    wrmsse = np.sum(wrmsse_i) / 12  # <-used to be mistake here
     if score_only:
-        return (
-            np.sum(
-                np.sqrt(np.mean(np.square(rollup(roll_mat_csr, error)), axis=1)) * sw
-            )
-            / 12
-        )  # <-used to be mistake here
-    else:
-        score_matrix = (
-            np.square(rollup(roll_mat_csr, error)) * np.square(w)[:, None]
-        ) / s[:, None]
-        wrmsse_i = np.sqrt(np.mean(score_matrix, axis=1))
-        wrmsse_raw = np.sqrt(score_matrix)
-
-        aggregation_count = [1, 3, 10, 3, 7, 9, 21, 30, 70, 3049, 9147, 30490]
-
-        idx = 0
-        aggregated_wrmsse = np.zeros(12)
-        aggregated_wrmsse_per_day = np.zeros([12, prediction_length])
-        for i, count in enumerate(aggregation_count):
-            endIdx = idx + count
-            aggregated_wrmsse[i] = wrmsse_i[idx:endIdx].sum()
-            aggregated_wrmsse_per_day[i] = wrmsse_raw[idx:endIdx, :].sum(axis=0)
-            idx = endIdx
-
-        # score == aggregated_wrmsse.mean()
-        wrmsse = np.sum(wrmsse_i) / 12  # <-used to be mistake here
-
-        return (
-            wrmsse,
-            aggregated_wrmsse,
-            aggregated_wrmsse_per_day,
-            score_matrix,
-        )
+        return wrmsse
 
+    if level_offsets is None:
+        level_offsets = np.cumsum([0] + AGGREGATION_COUNT[:-1])
 
-def calculate_and_save_data(
-    data_path: str, prediction_start: int
-) -> Tuple[Any, Any, Any, Any, Any]:
-    # Sales quantities:
-    sales = pd.read_csv(data_path + "/sales_train_evaluation.csv")
+    # sqrt(score_matrix), i.e. the absolute errors weighted by sw
+    wrmsse_raw = np.abs(rolled_up, out=rolled_up)
+    wrmsse_raw *= sw[:, None]
 
-    # Calendar to get week number to join sell prices:
-    calendar = pd.read_csv(data_path + "/calendar.csv")
-    calendar = reduce_mem_usage(calendar)
+    # sums over the aggregates of every level
+    aggregated_wrmsse = np.add.reduceat(wrmsse_i, level_offsets)
+    aggregated_wrmsse_per_day = np.add.reduceat(wrmsse_raw, level_offsets, axis=0)
 
-    # Sell prices to calculate sales in USD:
-    sell_prices = pd.read_csv(data_path + "/sell_prices.csv")
-    sell_prices = reduce_mem_usage(sell_prices)
+    score_matrix = np.square(wrmsse_raw) if return_raw else None
+
+    return (
+        wrmsse,
+        aggregated_wrmsse,
+        aggregated_wrmsse_per_day,
+        score_matrix,
+    )
+
+
+# Function to calculate WRMSSE of many forecasts at once:
+def wrmsse_batch(
+    errors: Any, roll_mat_csr: csr_matrix, sw: Any, level_offsets: Any = None
+) -> Any:
+    """
+    errors - np.array of size (30490 rows, K forecasts, N day columns)
+    sw - sales weights divided by the scale: np.array (42840,), or
+        (42840, K) with the weights of every forecast
+    level_offsets - first row of every aggregation level in the rollup matrix
+
+    Rolls up the errors of all forecasts with one sparse product and returns
+    the K scores, and the (K, 12) scores per aggregation level if
+    ``level_offsets`` is given.
+    """
+    n_series, n_forecasts, n_days = errors.shape
+    rolled_up = rollup(roll_mat_csr, errors.reshape(n_series, n_forecasts * n_days))
+    rolled_up = rolled_up.reshape(-1, n_forecasts, n_days)
+
+    # weighted RMSSE of every aggregate and forecast
+    squared_error = np.einsum("akd,akd->ak", rolled_up, rolled_up)
+    wrmsse_i = np.sqrt(squared_error / n_days) * (sw[:, None] if sw.ndim == 1 else sw)
+    scores = np.sum(wrmsse_i, axis=0) / 12
+
+    if level_offsets is None:
+        return scores
 
+    return scores, np.add.reduceat(wrmsse_i, level_offsets, axis=0).T
+
+
+def build_roll_mat(sales: pd.DataFrame) -> Tuple[csr_matrix, pd.MultiIndex]:
+    """Builds the sparse (aggregate x series) rollup matrix of the 12 levels.
+
+    Aggregates of every level are ordered by first appearance in ``sales``.
+    Returns the matrix and its (level, id) index.
+    """
+    # List of categories combinations for aggregations as defined in docs,
+    # first element Level_0 aggregation 'all_sales':
+    dummies_list = [
+        pd.Series("all", index=sales.index),
+        sales.state_id,
+        sales.store_id,
+        sales.cat_id,
+        sales.dept_id,
+        sales.state_id + "_" + sales.cat_id,
+        sales.state_id + "_" + sales.dept_id,
+        sales.store_id + "_" + sales.cat_id,
+        sales.store_id + "_" + sales.dept_id,
+        sales.item_id,
+        sales.state_id + "_" + sales.item_id,
+        sales.id,
+    ]
+
+    # [1, 3, 10, 3, 7, 9, 21, 30, 70, 3049, 9147, 30490]
+    # Every series belongs to exactly one aggregate per level:
+    rows = []
+    levels = []
+    ids = []
+    n_aggregates = 0
+    for level, cats in enumerate(dummies_list):
+        codes, uniques = pd.factorize(cats.values)
+        rows.append(codes + n_aggregates)
+        levels.append(np.full(len(uniques), level))
+        ids.append(uniques)
+        n_aggregates += len(uniques)
+
+    n_series = sales.shape[0]
+    roll_mat_csr = csr_matrix(
+        (
+            np.ones(len(dummies_list) * n_series, dtype=np.int8),
+            (np.concatenate(rows), np.tile(np.arange(n_series), len(dummies_list))),
+        ),
+        shape=(n_aggregates, n_series),
+    )
+    roll_index = pd.MultiIndex.from_arrays(
+        [np.concatenate(levels), np.concatenate(ids)], names=["level", "id"]
+    )
+
+    return roll_mat_csr, roll_index
+
+
+def build_and_save_roll_mat(
+    data_path: str, sales: pd.DataFrame
+) -> Tuple[csr_matrix, pd.MultiIndex]:
+    roll_mat_csr, roll_index = build_roll_mat(sales)
+
+    with atomic_path(Path(data_path) / ROLL_MAT_FILE) as tmp_file:
+        save_npz(tmp_file, roll_mat_csr, compressed=False)
+    # index as plain arrays, ids as fixed width strings to be loaded without pickle
+    index_arrays = {
+        "level": roll_index.get_level_values("level").values.astype(np.int8),
+        "id": roll_index.get_level_values("id").values.astype(str),
+    }
+    for name, index_file in ROLL_INDEX_FILES.items():
+        with atomic_path(Path(data_path) / index_file) as tmp_file:
+            np.save(tmp_file, index_arrays[name])
+
+    return roll_mat_csr, roll_index
+
+
+def load_roll_mat(data_path: str) -> Tuple[csr_matrix, pd.MultiIndex]:
+    roll_mat_csr = load_npz(f"{data_path}/{ROLL_MAT_FILE}")
+    roll_index = pd.MultiIndex.from_arrays(
+        [
+            np.load(f"{data_path}/{index_file}", mmap_mode="r")
+            for index_file in ROLL_INDEX_FILES.values()
+        ],
+        names=list(ROLL_INDEX_FILES),
+    )
+
+    return roll_mat_csr, roll_index
+
+
+# Function to calculate the daily sales in USD of the last 28 days:
+def get_sale_usd(
+    sales: pd.DataFrame,
+    calendar: pd.DataFrame,
+    sell_prices: pd.DataFrame,
+    prediction_start: int,
+) -> pd.DataFrame:
     # Dataframe with only last 28 days:
     cols = [f"d_{i}" for i in range(prediction_start - 28, prediction_start)]
     data = sales[["id", "store_id", "item_id"] + cols]
@@ -175,126 +378,408 @@ def calculate_and_save_data(
     # Calculate daily sales in USD:
     data["sale_usd"] = data["sale"] * data["sell_price"]
 
-    # List of categories combinations for aggregations as defined in docs:
-    dummies_list = [
-        sales.state_id,
-        sales.store_id,
-        sales.cat_id,
-        sales.dept_id,
-        sales.state_id + "_" + sales.cat_id,
-        sales.state_id + "_" + sales.dept_id,
-        sales.store_id + "_" + sales.cat_id,
-        sales.store_id + "_" + sales.dept_id,
-        sales.item_id,
-        sales.state_id + "_" + sales.item_id,
-        sales.id,
-    ]
+    return data[["id", "sale_usd"]]
 
-    ## First element Level_0 aggregation 'all_sales':
-    dummies_df_list = [
-        pd.DataFrame(
-            np.ones(sales.shape[0]).astype(np.int8),
-            index=sales.index,
-            columns=["all"],
-        ).T
-    ]
 
-    # List of dummy dataframes:
-    for _, cats in enumerate(dummies_list):
-        cat_dtype = pd.api.types.CategoricalDtype(
-            categories=pd.unique(cats.values), ordered=True
-        )
-        ordered_cat = cats.astype(cat_dtype)
-        dummies_df_list += [
-            pd.get_dummies(ordered_cat, drop_first=False, dtype=np.int8).T
-        ]
+def read_weight_data(data_path: str) -> Tuple[Any, Any, Any]:
+    """Reads the sales, calendar and sell prices needed for the weights."""
+    # Sales quantities:
+    sales = pd.read_csv(data_path + "/sales_train_evaluation.csv")
 
-    # [1, 3, 10, 3, 7, 9, 21, 30, 70, 3049, 9147, 30490]
-    # Concat dummy dataframes in one go:
-    ## Level is constructed for free.
-    roll_mat_df = pd.concat(
-        dummies_df_list, keys=list(range(12)), names=["level", "id"]
-    )  # .astype(np.int8, copy=False)
+    # Calendar to get week number to join sell prices:
+    calendar = pd.read_csv(data_path + "/calendar.csv")
+    calendar = reduce_mem_usage(calendar)
 
-    # Save values as sparse matrix & save index for future reference:
-    roll_index = roll_mat_df.index
-    roll_mat_csr = csr_matrix(roll_mat_df.values)
+    # Sell prices to calculate sales in USD:
+    sell_prices = pd.read_csv(data_path + "/sell_prices.csv")
+    sell_prices = reduce_mem_usage(sell_prices)
 
-    # nosemgrep
-    roll_mat_df.to_pickle(data_path + "/ordered_roll_mat_df.pkl")
+    return sales, calendar, sell_prices
+
+
+def ensure_roll_mat(data_path: str, sales: pd.DataFrame) -> csr_matrix:
+    # Rollup matrix, rebuilt only if the sales file changed:
+    roll_mat = ensure_artifact(
+        data_path,
+        ROLL_MAT_FILE,
+        ROLL_MAT_SOURCES,
+        ROLL_MAT_OUTPUTS,
+        lambda: build_and_save_roll_mat(data_path, sales),
+    )
+    roll_mat_csr, _ = load_roll_mat(data_path) if roll_mat is None else roll_mat
+    return roll_mat_csr
+
+
+def calculate_and_save_data(
+    data_path: str, prediction_start: int
+) -> Tuple[Any, Any, Any, Any, Any]:
+    sales, calendar, sell_prices = read_weight_data(data_path)
+    data = get_sale_usd(sales, calendar, sell_prices, prediction_start)
 
-    del dummies_df_list, roll_mat_df
-    gc.collect()
+    roll_mat_csr = ensure_roll_mat(data_path, sales)
 
     S = get_s(roll_mat_csr, sales, prediction_start)
-    W = get_w(roll_mat_csr, data[["id", "sale_usd"]])
+    W = get_w(roll_mat_csr, data)
     SW = W / np.sqrt(S)
 
-    sw_df = pd.DataFrame(
-        np.stack((S, W, SW), axis=-1),
-        index=roll_index,
-        columns=["s", "w", "sw"],
-    )
-    # nosemgrep
-    sw_df.to_pickle(data_path + f"/ordered_sw_df_p{prediction_start}.pkl")
+    with atomic_path(Path(data_path) / sw_file(prediction_start)) as tmp_file:
+        np.save(tmp_file, np.stack((S, W, SW)))
+    record_artifact(data_path, sw_file(prediction_start), SW_SOURCES)
 
     return sales, S, W, SW, roll_mat_csr
 
 
+def calculate_and_save_backtest_data(
+    data_path: str, prediction_starts: Sequence[int]
+) -> Dict[str, Any]:
+    """Calculates S, W and SW of all ``prediction_starts`` and saves them.
+
+    The S weights of all origins are calculated in one pass over the sales.
+    Returns arrays of size (origins, aggregates) and the prediction starts.
+    """
+    sales, calendar, sell_prices = read_weight_data(data_path)
+    roll_mat_csr = ensure_roll_mat(data_path, sales)
+
+    S = get_s_origins(roll_mat_csr, sales, prediction_starts)
+    W = np.stack(
+        [
+            get_w(roll_mat_csr, get_sale_usd(sales, calendar, sell_prices, start))
+            for start in prediction_starts
+        ]
+    )
+    backtest_data = {
+        "prediction_start": np.asarray(prediction_starts),
+        "s": S,
+        "w": W,
+        "sw": W / np.sqrt(S),
+    }
+
+    with atomic_path(Path(data_path) / SW_BACKTEST_FILE) as tmp_file:
+        np.savez(tmp_file, **backtest_data)
+    record_artifact(data_path, SW_BACKTEST_FILE, SW_SOURCES)
+
+    return backtest_data
+
+
+def load_backtest_data(
+    data_path: str, prediction_starts: Sequence[int]
+) -> Dict[str, Any]:
+    """Loads S, W and SW of ``prediction_starts``, in that order.
+
+    The saved weights are recalculated if the csv files changed or if an
+    origin is missing; the origins saved before are kept.
+    """
+
+    def load() -> Any:
+        if not is_artifact_fresh(
+            data_path, SW_BACKTEST_FILE, SW_SOURCES, [SW_BACKTEST_FILE]
+        ):
+            return None
+        with np.load(f"{data_path}/{SW_BACKTEST_FILE}") as backtest_npz:
+            backtest_data = dict(backtest_npz)
+        if not set(prediction_starts) <= set(backtest_data["prediction_start"]):
+            return None
+        return backtest_data
+
+    backtest_data = load()
+    if backtest_data is None:
+        with artifact_lock(data_path, SW_BACKTEST_FILE):
+            # another process may have calculated the data in the meantime
+            backtest_data = load()
+            if backtest_data is None:
+                saved_starts: List[int] = []
+                if (Path(data_path) / SW_BACKTEST_FILE).exists():
+                    with np.load(f"{data_path}/{SW_BACKTEST_FILE}") as backtest_npz:
+                        saved_starts = backtest_npz["prediction_start"].tolist()
+                backtest_data = calculate_and_save_backtest_data(
+                    data_path, sorted(set(prediction_starts) | set(saved_starts))
+                )
+
+    index = [
+        backtest_data["prediction_start"].tolist().index(start)
+        for start in prediction_starts
+    ]
+    return {name: values[index] for name, values in backtest_data.items()}
+
+
+def is_precalculated(data_path: str, prediction_start: int) -> bool:
+    """Checks if the precalculated data is built from the current csv files."""
+    return is_artifact_fresh(
+        data_path, ROLL_MAT_FILE, ROLL_MAT_SOURCES, ROLL_MAT_OUTPUTS
+    ) and is_artifact_fresh(
+        data_path,
+        sw_file(prediction_start),
+        SW_SOURCES,
+        [sw_file(prediction_start)],
+    )
+
+
 def load_precalculated_data(
     data_path: str, prediction_start: int
 ) -> Tuple[Any, Any, Any, csr_matrix]:
     # Load S and W weights for WRMSSE calcualtions:
-    if not os.path.exists(data_path + f"/ordered_sw_df_p{prediction_start}.pkl"):
-        calculate_and_save_data(data_path, prediction_start)
-    # nosemgrep
-    sw_df = pd.read_pickle(
-        data_path + f"/ordered_sw_df_p{prediction_start}.pkl"
-    )  # nosec: [B301:blacklist]
-    S = sw_df.s.values
-    W = sw_df.w.values
-    SW = sw_df.sw.values
+    if not is_precalculated(data_path, prediction_start):
+        with artifact_lock(data_path, sw_file(prediction_start)):
+            if not is_precalculated(data_path, prediction_start):
+                calculate_and_save_data(data_path, prediction_start)
+    S, W, SW = np.load(f"{data_path}/{sw_file(prediction_start)}", mmap_mode="r")
 
     # Load roll up matrix to calcualte aggreagates:
-    # nosemgrep
-    roll_mat_df = pd.read_pickle(
-        data_path + "/ordered_roll_mat_df.pkl"
-    )  # nosec: [B301:blacklist]
-    roll_mat_csr = csr_matrix(roll_mat_df.values)
-    del roll_mat_df
+    roll_mat_csr, _ = load_roll_mat(data_path)
 
     return S, W, SW, roll_mat_csr
 
 
-def evaluate_wrmsse(
-    data_path: str, prediction: Any, prediction_start: int, score_only: bool = True
-) -> Any:
-    # Loading data in two ways:
-    # if S, W, SW are calculated in advance, load from pickle files
-    # otherwise, calculate from scratch
-    if os.path.isfile(
-        data_path + f"/ordered_sw_df_p{prediction_start}.pkl"
-    ) and os.path.isfile(data_path + "/ordered_roll_mat_df.pkl"):
-        print("load precalculated data")
-        # Sales quantities:
-        sales = pd.read_csv(data_path + "/sales_train_evaluation.csv")
-        S, W, SW, roll_mat_csr = load_precalculated_data(data_path, prediction_start)
-    else:
-        print("load data from scratch")
-        sales, S, W, SW, roll_mat_csr = calculate_and_save_data(
-            data_path, prediction_start
+def _source_stats(data_path: str) -> Dict[str, Tuple[int, int]]:
+    stats = {source: os.stat(f"{data_path}/{source}") for source in SW_SOURCES}
+    return {source: (stat.st_size, stat.st_mtime_ns) for source, stat in stats.items()}
+
+
+class WRMSSEEvaluator:
+    """
+    Scores forecasts of the M5 dataset with the WRMSSE.
+
+    The weights, the rollup matrix and the ground truth of the forecast horizon
+    are loaded once, so any number of forecasts can be scored without reading
+    the csv and cache files again. Use ``get_wrmsse_evaluator`` to share
+    evaluators within a process.
+
+    Parameters
+    ----------
+    data_path
+        Directory with the M5 csv files.
+    prediction_start
+        First day of the forecast horizon, e.g. ``VAL_START``.
+    """
+
+    def __init__(self, data_path: str, prediction_start: int) -> None:
+        self.data_path = data_path
+        self.prediction_start = prediction_start
+        self.source_stats = _source_stats(data_path)
+
+        day_cols = [
+            f"d_{i}"
+            for i in range(prediction_start, prediction_start + prediction_length)
+        ]
+
+        # Loading data in two ways:
+        # if S, W, SW are calculated from the current csv files, load from
+        # cache files, otherwise, calculate from scratch
+        sales = None
+        if not is_precalculated(data_path, prediction_start):
+            with artifact_lock(data_path, sw_file(prediction_start)):
+                # another process may have calculated the data in the meantime
+                if not is_precalculated(data_path, prediction_start):
+                    print("load data from scratch")
+                    sales, S, W, SW, roll_mat_csr = calculate_and_save_data(
+                        data_path, prediction_start
+                    )
+        if sales is None:
+            print("load precalculated data")
+            S, W, SW, roll_mat_csr = load_precalculated_data(
+                data_path, prediction_start
+            )
+            # Sales quantities of the forecast horizon:
+            sales = pd.read_csv(
+                data_path + "/sales_train_evaluation.csv", usecols=day_cols
+            )
+
+        self.s = S
+        self.w = W
+        self.sw = SW
+        self.roll_mat_csr = roll_mat_csr
+        levels = np.load(f"{data_path}/{ROLL_INDEX_FILES['level']}")
+        self.level_offsets = np.flatnonzero(np.diff(levels, prepend=-1))
+        # Ground truth:
+        self.y_true = sales[day_cols].values
+
+    def is_stale(self) -> bool:
+        """Checks if the csv files changed since the evaluator was created."""
+        return _source_stats(self.data_path) != self.source_stats
+
+    def evaluate(
+        self, prediction: Any, score_only: bool = True, return_raw: bool = True
+    ) -> Any:
+        """Computes the WRMSSE of a (series x day) forecast matrix.
+
+        Returns only the score if ``score_only`` is set, otherwise also the
+        scores per aggregation level and per level and day, and the raw score
+        matrix if ``return_raw`` is set.
+        """
+        error = prediction - self.y_true
+        return wrmsse(
+            error,
+            score_only,
+            self.roll_mat_csr,
+            self.s,
+            self.w,
+            self.sw,
+            level_offsets=self.level_offsets,
+            return_raw=return_raw,
         )
 
-    # Ground truth:
-    dayCols = [
-        f"d_{i}" for i in range(prediction_start, prediction_start + prediction_length)
-    ]
-    y_true = sales[dayCols]
+    def evaluate_batch(self, predictions: Any, per_level: bool = False) -> Any:
+        """Computes the WRMSSE of a stack of (series x day) forecast matrices.
+
+        ``predictions`` has the shape (forecasts x series x days); all forecasts
+        are rolled up with a single sparse product. Returns the score of every
+        forecast and, if ``per_level`` is set, also the (forecasts x levels)
+        scores per aggregation level.
+        """
+        predictions = np.asarray(predictions)
+        n_forecasts = predictions.shape[0]
+        n_series, n_days = self.y_true.shape
+
+        # errors as (series x forecasts x days), to be rolled up in one product
+        errors = np.empty((n_series, n_forecasts, n_days))
+        np.subtract(predictions.transpose(1, 0, 2), self.y_true[:, None, :], out=errors)
+
+        return wrmsse_batch(
+            errors,
+            self.roll_mat_csr,
+            self.sw,
+            self.level_offsets if per_level else None,
+        )
 
-    error = prediction - y_true.values
-    results = wrmsse(error, score_only, roll_mat_csr, S, W, SW)
 
-    return results
+class WRMSSEAccumulator:
+    """
+    Collects forecast means in series order and computes the WRMSSE at the end.
+
+    Only the means are kept, in a preallocated (series x day) buffer, so
+    forecasts can be discarded as soon as they are added and memory use does
+    not depend on the number of samples per forecast.
+
+    Parameters
+    ----------
+    evaluator
+        Evaluator of the forecast horizon.
+    """
+
+    def __init__(self, evaluator: WRMSSEEvaluator) -> None:
+        self.evaluator = evaluator
+        self.means = np.empty(evaluator.y_true.shape)
+        self.n_series = 0
+
+    def update(self, means: Any) -> None:
+        """Adds the (series x day) means of the next forecasts."""
+        means = np.reshape(means, (-1, self.means.shape[1]))
+        end = self.n_series + len(means)
+        if end > len(self.means):
+            raise ValueError(
+                f"Got forecasts for {end} series, expected {len(self.means)}"
+            )
+        self.means[self.n_series : end] = means
+        self.n_series = end
+
+    def score(self, score_only: bool = True) -> Any:
+        """Computes the WRMSSE of all added forecasts."""
+        if self.n_series != len(self.means):
+            raise ValueError(
+                f"Got forecasts for {self.n_series} series, "
+                f"expected {len(self.means)}"
+            )
+        return self.evaluator.evaluate(self.means, score_only=score_only)
+
+
+class WRMSSEBacktestEvaluator:
+    """
+    Scores forecasts of several forecast origins of the M5 dataset with the
+    WRMSSE.
+
+    The weights of all origins are calculated in one pass over the sales and
+    saved in a single file, indexed by the prediction start. The rollup matrix
+    and the ground truth of all horizons are loaded once.
+
+    Parameters
+    ----------
+    data_path
+        Directory with the M5 csv files.
+    prediction_starts
+        First days of the forecast horizons, e.g. ``[VAL_START, TEST_START]``.
+        The sales file must contain the days of all horizons.
+    """
+
+    def __init__(self, data_path: str, prediction_starts: Sequence[int]) -> None:
+        self.data_path = data_path
+        self.prediction_starts = list(prediction_starts)
+
+        day_cols = [
+            [f"d_{i}" for i in range(start, start + prediction_length)]
+            for start in self.prediction_starts
+        ]
+        sales_file = data_path + "/sales_train_evaluation.csv"
+        available_cols = set(pd.read_csv(sales_file, nrows=0).columns)
+        for start, cols in zip(self.prediction_starts, day_cols):
+            if not set(cols) <= available_cols:
+                raise ValueError(
+                    f"The sales file has no ground truth for prediction start {start}"
+                )
+
+        backtest_data = load_backtest_data(data_path, self.prediction_starts)
+        self.s = backtest_data["s"]
+        self.w = backtest_data["w"]
+        self.sw = backtest_data["sw"]
+        self.roll_mat_csr, roll_index = load_roll_mat(data_path)
+        self.level_offsets = np.flatnonzero(
+            np.diff(roll_index.get_level_values("level"), prepend=-1)
+        )
+
+        # Ground truth of all horizons:
+        sales = pd.read_csv(
+            sales_file, usecols=sorted({col for cols in day_cols for col in cols})
+        )
+        self.y_true = np.stack([sales[cols].values for cols in day_cols])
+
+    def evaluate(self, predictions: Any, per_level: bool = False) -> Any:
+        """Computes the WRMSSE of one forecast per origin.
+
+        ``predictions`` has the shape (origins x series x days), in the order
+        of ``prediction_starts``; all forecasts are rolled up with a single
+        sparse product. Returns the score of every origin and, if
+        ``per_level`` is set, also the (origins x levels) scores per
+        aggregation level.
+        """
+        predictions = np.asarray(predictions)
+        n_origins, n_series, n_days = self.y_true.shape
+
+        # errors as (series x origins x days), to be rolled up in one product
+        errors = np.empty((n_series, n_origins, n_days))
+        np.subtract(
+            predictions.transpose(1, 0, 2), self.y_true.transpose(1, 0, 2), out=errors
+        )
+
+        return wrmsse_batch(
+            errors,
+            self.roll_mat_csr,
+            self.sw.T,
+            self.level_offsets if per_level else None,
+        )
+
+
+_wrmsse_evaluators: Dict[Tuple[str, int], WRMSSEEvaluator] = {}
+
+
+def get_wrmsse_evaluator(data_path: str, prediction_start: int) -> WRMSSEEvaluator:
+    """Returns the evaluator for ``data_path`` and ``prediction_start``.
+
+    Evaluators are created once per process and recreated only if the csv
+    files changed.
+    """
+    key = (os.path.abspath(data_path), prediction_start)
+    evaluator = _wrmsse_evaluators.get(key)
+    if evaluator is None or evaluator.is_stale():
+        evaluator = WRMSSEEvaluator(data_path, prediction_start)
+        _wrmsse_evaluators[key] = evaluator
+
+    return evaluator
+
+
+def evaluate_wrmsse(
+    data_path: str, prediction: Any, prediction_start: int, score_only: bool = True
+) -> Any:
+    evaluator = get_wrmsse_evaluator(data_path, prediction_start)
+    return evaluator.evaluate(prediction, score_only=score_only)
 
 
 if __name__ == "__main__":
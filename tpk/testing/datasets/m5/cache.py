@@ -0,0 +1,182 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+import numpy as np
+
+from tpk.utils.cache import artifact_lock, atomic_path
+
+BINARY_CACHE_DIR = "binary"
+COMPACT_BINARY_CACHE_DIR = "binary_compact"
+BINARY_CACHE_ARRAYS = [
+    "target",
+    "price_features",
+    "calendar_features",
+    "stat_cat",
+    "cardinalities",
+]
+MANIFEST_FILE = "cache_manifest.json"
+
+T = TypeVar("T")
+
+
+def file_fingerprint(
+    path: Path, previous: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """Returns size, modification time and blake2b hash of a file.
+
+    The hash is taken over from ``previous`` if size and modification time did
+    not change, so unchanged files are not read again.
+    """
+    stat = path.stat()
+    if (
+        previous is not None
+        and previous["size"] == stat.st_size
+        and previous["mtime_ns"] == stat.st_mtime_ns
+    ):
+        return previous
+
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "blake2b": _hash_file(path),
+    }
+
+
+def _hash_file(path: Path) -> str:
+    file_hash = hashlib.blake2b(digest_size=16)
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def _read_manifest(data_dir: str) -> Dict[str, Any]:
+    manifest_file = Path(data_dir) / MANIFEST_FILE
+    if not manifest_file.exists():
+        return {}
+    return json.loads(manifest_file.read_text())  # type: ignore[no-any-return]
+
+
+def _write_manifest(data_dir: str, manifest: Dict[str, Any]) -> None:
+    with atomic_path(Path(data_dir) / MANIFEST_FILE) as tmp_path:
+        tmp_path.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+
+
+def is_artifact_fresh(
+    data_dir: str, artifact: str, sources: List[str], outputs: List[str]
+) -> bool:
+    """Checks if ``artifact`` was built from the current ``sources``.
+
+    The artifact is fresh if all its ``outputs`` exist and the manifest records
+    the fingerprints of the current source files. Sources whose modification
+    time changed are hashed, so touched but unchanged files do not invalidate
+    the artifact; their new modification time is recorded, so they are not
+    hashed again.
+    """
+    if not all((Path(data_dir) / output).exists() for output in outputs):
+        return False
+
+    recorded = _read_manifest(data_dir).get(artifact)
+    if recorded is None or sorted(recorded) != sorted(sources):
+        return False
+
+    touched = {}
+    for source in sources:
+        previous = recorded[source]
+        current = file_fingerprint(Path(data_dir) / source, previous)
+        if (current["size"], current["blake2b"]) != (
+            previous["size"],
+            previous["blake2b"],
+        ):
+            return False
+        if current is not previous:
+            touched[source] = current
+
+    if touched:
+        with artifact_lock(data_dir, MANIFEST_FILE):
+            manifest = _read_manifest(data_dir)
+            # the artifact may have been rebuilt from other sources meanwhile
+            if manifest.get(artifact) == recorded:
+                manifest[artifact] = {**recorded, **touched}
+                _write_manifest(data_dir, manifest)
+
+    return True
+
+
+def record_artifact(data_dir: str, artifact: str, sources: List[str]) -> None:
+    """Records the fingerprints of ``sources`` for ``artifact`` in the manifest."""
+    with artifact_lock(data_dir, MANIFEST_FILE):
+        manifest = _read_manifest(data_dir)
+        previous = manifest.get(artifact, {})
+        manifest[artifact] = {
+            source: file_fingerprint(Path(data_dir) / source, previous.get(source))
+            for source in sources
+        }
+        _write_manifest(data_dir, manifest)
+
+
+def ensure_artifact(
+    data_dir: str,
+    artifact: str,
+    sources: List[str],
+    outputs: List[str],
+    build: Callable[[], T],
+) -> Optional[T]:
+    """(Re)builds ``artifact`` if it is missing or stale.
+
+    ``build`` must write the ``outputs`` atomically (e.g. with ``atomic_path``),
+    so concurrent readers see either the old or the new files. Concurrent
+    builders wait for each other, so a stale artifact is rebuilt only once.
+
+    Returns the result of ``build`` if it was called and ``None`` if the
+    artifact was fresh.
+    """
+    if is_artifact_fresh(data_dir, artifact, sources, outputs):
+        return None
+
+    with artifact_lock(data_dir, artifact):
+        if is_artifact_fresh(data_dir, artifact, sources, outputs):
+            return None
+
+        result = build()
+        record_artifact(data_dir, artifact, sources)
+
+    return result
+
+
+def binary_cache_files(cache_dir_name: str = BINARY_CACHE_DIR) -> List[str]:
+    """Returns the files of a binary cache, relative to the data directory."""
+    return [f"{cache_dir_name}/{name}.npy" for name in BINARY_CACHE_ARRAYS]
+
+
+def save_binary_cache(
+    data_dir: str, arrays: Dict[str, Any], cache_dir_name: str = BINARY_CACHE_DIR
+) -> None:
+    """Writes the arrays of a parsed M5 dataset as ``.npy`` files.
+
+    Every array is first written to a temporary file and then moved into place,
+    so a reader never sees a partially written array.
+    """
+    cache_dir = Path(data_dir) / cache_dir_name
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    for name in BINARY_CACHE_ARRAYS:
+        with atomic_path(cache_dir / f"{name}.npy") as tmp_file:
+            np.save(tmp_file, np.ascontiguousarray(arrays[name]))
+
+
+def load_binary_cache(
+    data_dir: str, cache_dir_name: str = BINARY_CACHE_DIR
+) -> Optional[Dict[str, Any]]:
+    """Opens the arrays written by ``save_binary_cache`` as memory maps.
+
+    Returns ``None`` if the cache has not been created yet.
+    """
+    cache_dir = Path(data_dir) / cache_dir_name
+    files = {name: cache_dir / f"{name}.npy" for name in BINARY_CACHE_ARRAYS}
+    if not all(file.exists() for file in files.values()):
+        return None
+
+    return {name: np.load(file, mmap_mode="r") for name, file in files.items()}
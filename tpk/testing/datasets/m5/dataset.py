@@ -0,0 +1,101 @@
+import hashlib
+from typing import Any, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+from gluonts.dataset.common import DataEntry
+from gluonts.dataset.field_names import FieldName
+
+
+class M5Dataset:
+    """
+    Dataset of M5 time series backed by a few contiguous arrays.
+
+    All series share one (series x day) target matrix, one
+    (series x feature x day) price feature tensor and one (feature x day)
+    calendar feature matrix. ``length`` selects the number of days exposed by
+    the dataset, so datasets of different lengths are views of the same arrays
+    and creating them costs nothing. Iterating over the dataset yields entries
+    in the format produced by ``gluonts.dataset.common.ListDataset``.
+
+    Parameters
+    ----------
+    target
+        Array of shape (num_series, num_days) with the target values.
+    price_features
+        Array of shape (num_series, num_price_features, num_days).
+    calendar_features
+        Array of shape (num_calendar_features, num_days) shared by all series.
+    stat_cat
+        Array of shape (num_series, num_feat_static_cat).
+    length
+        Number of days of each series exposed by the dataset
+        (default: all days of ``target``).
+    start
+        Start date of all series.
+    freq
+        Frequency of the series.
+    """
+
+    def __init__(
+        self,
+        *,
+        target: Any,
+        price_features: Any,
+        calendar_features: Any,
+        stat_cat: Any,
+        length: Optional[int] = None,
+        start: str = "2011-01-29",
+        freq: str = "D",
+    ) -> None:
+        self.target = target
+        self.price_features = price_features
+        self.calendar_features = calendar_features
+        self.stat_cat = stat_cat
+        self.length = length if length is not None else target.shape[1]
+        self.start = start
+        self.freq = freq
+
+    def with_length(self, length: int) -> "M5Dataset":
+        """Returns a view of the dataset exposing the first ``length`` days."""
+        return M5Dataset(
+            target=self.target,
+            price_features=self.price_features,
+            calendar_features=self.calendar_features,
+            stat_cat=self.stat_cat,
+            length=length,
+            start=self.start,
+            freq=self.freq,
+        )
+
+    def __len__(self) -> int:
+        return len(self.target)
+
+    def fingerprint(self) -> str:
+        """Returns a hash of the arrays, length, start and frequency."""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{self.length}{self.start}{self.freq}".encode())
+        for array in [
+            self.target,
+            self.price_features,
+            self.calendar_features,
+            self.stat_cat,
+        ]:
+            array = np.ascontiguousarray(array)
+            digest.update(f"{array.dtype}{array.shape}".encode())
+            digest.update(array.data)
+        return digest.hexdigest()
+
+    def __iter__(self) -> Iterator[DataEntry]:
+        start = pd.Period(self.start, freq=self.freq)
+        calendar_features = self.calendar_features[:, : self.length]
+
+        for i in range(len(self)):
+            yield {
+                FieldName.TARGET: self.target[i, : self.length],
+                FieldName.START: start,
+                FieldName.FEAT_DYNAMIC_REAL: np.concatenate(
+                    [self.price_features[i, :, : self.length], calendar_features]
+                ),
+                FieldName.FEAT_STATIC_CAT: self.stat_cat[i],
+            }
@@ -1,59 +1,163 @@
 from pathlib import Path
-from typing import List, Tuple
+from typing import Any, Dict, List, Tuple
 
 import numpy as np
 import pandas as pd
-from gluonts.dataset.common import ListDataset
-from gluonts.dataset.field_names import FieldName
+from scipy.sparse import csr_matrix
+
+from tpk.utils.cache import atomic_path
+
+from .cache import (
+    BINARY_CACHE_DIR,
+    COMPACT_BINARY_CACHE_DIR,
+    binary_cache_files,
+    ensure_artifact,
+    load_binary_cache,
+    save_binary_cache,
+)
+from .dataset import M5Dataset
 
 PREDICTION_LENGTH = 28
 N_TS = 30490
 VAL_START = 1886  # 1969 - 3 * 28 + 1
 TEST_START = 1914  # 1969 - 2 * 28 + 1
 
+# source files of the M5 dataset, all derived files are rebuilt if one changes
+M5_SOURCES = ["calendar.csv", "sales_train_evaluation.csv", "sell_prices.csv"]
+CONVERTED_PRICE_FILE = "converted_price_evaluation.npy"
+NORMALIZED_PRICE_FILE = "normalized_price_evaluation.npz"
 
-def convert_price_file(m5_input_path: str) -> None:
-    # load data
-    calendar = pd.read_csv(f"{m5_input_path}/calendar.csv")
-    sales_train_evaluation = pd.read_csv(f"{m5_input_path}/sales_train_evaluation.csv")
-    sell_prices = pd.read_csv(f"{m5_input_path}/sell_prices.csv")
 
-    # assign price for all days
-    week_and_day = calendar[["wm_yr_wk", "d"]]
+def convert_price_file(m5_input_path: str) -> Any:
+    """Builds the dense (series x day) sell price matrix and saves it as ``.npy``.
 
-    price_all_days_items = pd.merge(
-        week_and_day, sell_prices, on=["wm_yr_wk"], how="left"
-    )  # join on week number
-    price_all_days_items = price_all_days_items.drop(["wm_yr_wk"], axis=1)
+    Rows follow the order of ``sales_train_evaluation.csv`` and columns the days
+    of ``calendar.csv``; days without a listed price are ``nan``. Prices are
+    kept as the ``float64`` values parsed from ``sell_prices.csv``.
+    """
+    calendar = pd.read_csv(f"{m5_input_path}/calendar.csv", usecols=["wm_yr_wk"])
+    sales_keys = pd.read_csv(
+        f"{m5_input_path}/sales_train_evaluation.csv",
+        usecols=["store_id", "item_id"],
+    )
+    sell_prices = pd.read_csv(f"{m5_input_path}/sell_prices.csv")
 
-    # convert days to column
-    price_all_items = price_all_days_items.pivot_table(
-        values="sell_price", index=["store_id", "item_id"], columns="d"
+    # integer code for every (store_id, item_id) pair of the sales file
+    store_cat = pd.Categorical(sales_keys["store_id"])
+    item_cat = pd.Categorical(sales_keys["item_id"])
+    n_items = len(item_cat.categories)
+    series_lookup = np.full(len(store_cat.categories) * n_items, -1, dtype=np.int64)
+    series_lookup[
+        store_cat.codes.astype(np.int64) * n_items + item_cat.codes
+    ] = np.arange(len(sales_keys))
+
+    price_store_codes = pd.Categorical(
+        sell_prices["store_id"], categories=store_cat.categories
+    ).codes.astype(np.int64)
+    price_item_codes = pd.Categorical(
+        sell_prices["item_id"], categories=item_cat.categories
+    ).codes.astype(np.int64)
+    price_series = np.where(
+        (price_store_codes >= 0) & (price_item_codes >= 0),
+        series_lookup[price_store_codes * n_items + price_item_codes],
+        -1,
     )
-    price_all_items.reset_index(drop=False, inplace=True)
 
-    # reorder column
-    price_all_items = price_all_items.reindex(
-        ["store_id", "item_id"] + ["d_%d" % x for x in range(1, 1969 + 1)], axis=1
+    # integer code for every week of the calendar
+    weeks = np.unique(calendar["wm_yr_wk"].values)
+    day_weeks = np.searchsorted(weeks, calendar["wm_yr_wk"].values)
+    price_weeks = np.searchsorted(weeks, sell_prices["wm_yr_wk"].values)
+    price_weeks_known = (price_weeks < len(weeks)) & (
+        weeks[np.minimum(price_weeks, len(weeks) - 1)] == sell_prices["wm_yr_wk"].values
     )
 
-    sales_keys = ["id", "item_id", "dept_id", "cat_id", "store_id", "state_id"]
-    sales_keys_pd = sales_train_evaluation[sales_keys]
+    # scatter weekly prices and expand them to days
+    mask = (price_series >= 0) & price_weeks_known
+    price_per_week = np.full((len(sales_keys), len(weeks)), np.nan, dtype=np.float64)
+    price_per_week[price_series[mask], price_weeks[mask]] = sell_prices[
+        "sell_price"
+    ].values[mask]
+    price_converted = price_per_week[:, day_weeks]
 
-    # join with sales data
-    price_converted = pd.merge(
-        sales_keys_pd, price_all_items, on=["store_id", "item_id"], how="left"
+    # save file
+    with atomic_path(Path(m5_input_path) / CONVERTED_PRICE_FILE) as tmp_file:
+        np.save(tmp_file, price_converted)
+
+    return price_converted
+
+
+def normalize_per_group(values: Any, group_codes: Any) -> Any:
+    """Normalises every column of ``values`` within the rows of the same group.
+
+    Computes the same nan-skipping mean and standard deviation (``ddof=1``) as
+    ``pd.DataFrame.groupby(...).transform`` with ``np.nanmean`` and ``np.nanstd``
+    did, as segment sums of a sparse (group x row) indicator matrix.
+    """
+    group_codes = np.asarray(group_codes, dtype=np.int64)
+    indicator = csr_matrix(
+        (
+            np.ones(len(group_codes)),
+            (group_codes, np.arange(len(group_codes))),
+        ),
+        shape=(group_codes.max() + 1, len(group_codes)),
     )
 
-    # save file
-    price_converted.to_csv(
-        f"{m5_input_path}/converted_price_evaluation.csv", index=False
+    observed = ~np.isnan(values)
+    counts = indicator @ observed.astype(np.float64)
+    filled = np.where(observed, values, 0.0)
+    sums = indicator @ filled
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(counts > 0, sums / counts, np.nan)
+        centered = values - mean[group_codes]
+        np.copyto(filled, centered, where=observed)
+        squares = indicator @ np.square(filled, out=filled)
+        std = np.where(counts > 1, np.sqrt(squares / (counts - 1)), np.nan)
+
+    centered /= std[group_codes] + 1e-6
+    return centered
+
+
+def normalize_price_file(data_dir: str, dept_ids: Any) -> Tuple[Any, Any]:
+    """Normalises the sell prices per item and per department and saves them.
+
+    Returns the prices normalised over the days of every item and over the
+    items of the same department on every day.
+    """
+    # sell_prices
+    price_feature = ensure_artifact(
+        data_dir,
+        CONVERTED_PRICE_FILE,
+        M5_SOURCES,
+        [CONVERTED_PRICE_FILE],
+        lambda: convert_price_file(data_dir),
+    )
+    if price_feature is None:
+        price_feature = np.load(f"{data_dir}/{CONVERTED_PRICE_FILE}")
+    price_feature = np.asarray(price_feature, dtype=np.float64)
+
+    # normalized sell prices per each item
+    price_mean_per_item = np.nanmean(price_feature, axis=1, keepdims=True)
+    price_std_per_item = np.nanstd(price_feature, axis=1, keepdims=True)
+    normalized_price_per_item = (price_feature - price_mean_per_item) / (
+        price_std_per_item + 1e-6
     )
 
+    # normalized sell prices per day within the same dept
+    normalized_price_per_group = normalize_per_group(price_feature, dept_ids)
 
-def load_datasets(
-    data_dir: str,
-) -> Tuple[ListDataset, ListDataset, ListDataset, List[int]]:
+    with atomic_path(Path(data_dir) / NORMALIZED_PRICE_FILE) as tmp_file:
+        np.savez(
+            tmp_file,
+            per_item=normalized_price_per_item,
+            per_group=normalized_price_per_group,
+        )
+
+    return normalized_price_per_item, normalized_price_per_group
+
+
+def read_m5_arrays(data_dir: str) -> Dict[str, Any]:
+    """Parses the M5 csv files into the arrays used to build the datasets."""
     calendar = pd.read_csv(f"{data_dir}/calendar.csv")
     sales_train_evaluation = pd.read_csv(f"{data_dir}/sales_train_evaluation.csv")
 
@@ -79,7 +183,6 @@ def load_datasets(
     )
 
     event_features = cal_features.values.T
-    event_features_expand = np.tile(event_features, (len(sales_train_evaluation), 1, 1))
 
     state_ids = sales_train_evaluation["state_id"].astype("category").cat.codes.values
     state_ids_un, state_ids_counts = np.unique(state_ids, return_counts=True)
@@ -110,119 +213,118 @@ def load_datasets(
     train_df = sales_train_evaluation.drop(
         ["id", "item_id", "dept_id", "cat_id", "store_id", "state_id"], axis=1
     )
-    train_target_values = train_df.values
-
-    test_target_values = train_target_values.copy()
-    train_target_values = [ts[: -(2 * PREDICTION_LENGTH)] for ts in train_df.values]
-    val_target_values = [ts[:-PREDICTION_LENGTH] for ts in train_df.values]
 
     # snap features
     # snap_features = calendar[['snap_CA', 'snap_TX', 'snap_WI']]
     # snap_features = snap_features.values.T
     # snap_features_expand = np.array([snap_features] * len(sales_train_evaluation))    # 30490 * 3 * T
 
-    # sell_prices
-    converted_price_file = Path(f"{data_dir}/converted_price_evaluation.csv")
-    if not converted_price_file.exists():
-        convert_price_file(data_dir)
-    converted_price = pd.read_csv(converted_price_file)
-
-    price_feature = converted_price.drop(
-        ["id", "item_id", "dept_id", "cat_id", "store_id", "state_id"], axis=1
-    ).values
-
     # normalized sell prices
-    normalized_price_file = Path(f"{data_dir}/normalized_price_evaluation.npz")
-    if not normalized_price_file.exists():
-        # normalized sell prices per each item
-        price_mean_per_item = np.nanmean(price_feature, axis=1, keepdims=True)
-        price_std_per_item = np.nanstd(price_feature, axis=1, keepdims=True)
-        normalized_price_per_item = (price_feature - price_mean_per_item) / (
-            price_std_per_item + 1e-6
-        )
-
-        # normalized sell prices per day within the same dept
-        dept_groups = converted_price.drop(
-            ["id", "item_id", "cat_id", "store_id", "state_id"], axis=1
-        ).groupby("dept_id")
-        price_mean_per_dept = dept_groups.transform(np.nanmean)
-        price_std_per_dept = dept_groups.transform(np.nanstd)
-        normalized_price_per_group_pd = (
-            converted_price[price_mean_per_dept.columns] - price_mean_per_dept
-        ) / (price_std_per_dept + 1e-6)
-
-        normalized_price_per_group = normalized_price_per_group_pd.values
-        np.savez(
-            normalized_price_file,
-            per_item=normalized_price_per_item,
-            per_group=normalized_price_per_group,
-        )
+    normalized_price = ensure_artifact(
+        data_dir,
+        NORMALIZED_PRICE_FILE,
+        M5_SOURCES,
+        [NORMALIZED_PRICE_FILE],
+        lambda: normalize_price_file(data_dir, dept_ids),
+    )
+    if normalized_price is None:
+        with np.load(f"{data_dir}/{NORMALIZED_PRICE_FILE}") as normalized_price_npz:
+            normalized_price_per_item = normalized_price_npz["per_item"]
+            normalized_price_per_group = normalized_price_npz["per_group"]
     else:
-        normalized_price = np.load(normalized_price_file)
-        normalized_price_per_item = normalized_price["per_item"]
-        normalized_price_per_group = normalized_price["per_group"]
+        normalized_price_per_item, normalized_price_per_group = normalized_price
 
-    price_feature = np.nan_to_num(price_feature)
     normalized_price_per_item = np.nan_to_num(normalized_price_per_item)
     normalized_price_per_group = np.nan_to_num(normalized_price_per_group)
 
     all_price_features = np.stack(
         [normalized_price_per_item, normalized_price_per_group], axis=1
     )  # 30490 * 2 * T
-    # dynamic_real = np.concatenate([snap_features_expand, all_price_features, event_features_expand], axis=1)    # 30490 * 6 * T
-    dynamic_real = np.concatenate(
-        [all_price_features, event_features_expand], axis=1
-    )  # 30490 * 6 * T
 
-    train_dynamic_real = dynamic_real[..., : VAL_START - 1]
-    val_dynamic_real = dynamic_real[..., : TEST_START - 1]
-    test_dynamic_real = dynamic_real[..., :-PREDICTION_LENGTH]
+    return {
+        "target": train_df.values.astype(np.float32),
+        "price_features": all_price_features.astype(np.float32),
+        "calendar_features": event_features.astype(np.float32),
+        "stat_cat": stat_cat.astype(np.int32),
+        "cardinalities": np.array(stat_cat_cardinalities, dtype=np.int64),
+    }
+
+
+def compact_m5_arrays(arrays: Dict[str, Any]) -> Dict[str, Any]:
+    """Converts the M5 arrays to compact dtypes.
+
+    Targets become ``int16`` and calendar flags ``int8`` (both exact for M5),
+    price features ``float16`` and static category codes the smallest integer
+    type holding them.
+    """
+    target = arrays["target"]
+    if np.all(target == np.round(target)) and np.all(np.abs(target) < 2**15):
+        target = target.astype(np.int16)
+
+    calendar_features = arrays["calendar_features"]
+    if np.all(np.isin(calendar_features, [0, 1])):
+        calendar_features = calendar_features.astype(np.int8)
+
+    stat_cat = arrays["stat_cat"]
+    return {
+        "target": target,
+        "price_features": arrays["price_features"].astype(np.float16),
+        "calendar_features": calendar_features,
+        "stat_cat": stat_cat.astype(np.min_scalar_type(-int(stat_cat.max()) - 1)),
+        "cardinalities": arrays["cardinalities"],
+    }
+
+
+def load_m5_arrays(data_dir: str, compact: bool = False) -> Dict[str, Any]:
+    """Loads the M5 arrays from the binary cache as read-only memory maps.
+
+    The cache is (re)built if it is missing or if the source csv files changed
+    since it was built; the arrays are memory-mapped from the cache also right
+    after building it.
+    """
+    cache_dir_name = COMPACT_BINARY_CACHE_DIR if compact else BINARY_CACHE_DIR
+
+    def build() -> None:
+        arrays = (
+            compact_m5_arrays(load_m5_arrays(data_dir))
+            if compact
+            else read_m5_arrays(data_dir)
+        )
+        save_binary_cache(data_dir, arrays, cache_dir_name)
+
+    ensure_artifact(
+        data_dir,
+        cache_dir_name,
+        M5_SOURCES,
+        binary_cache_files(cache_dir_name),
+        build,
+    )
 
-    m5_dates = [pd.Timestamp("2011-01-29") for _ in range(len(sales_train_evaluation))]
+    return load_binary_cache(data_dir, cache_dir_name)  # type: ignore
 
-    train_ds = ListDataset(
-        [
-            {
-                FieldName.TARGET: target,
-                FieldName.START: start,
-                FieldName.FEAT_DYNAMIC_REAL: fdr,
-                FieldName.FEAT_STATIC_CAT: fsc,
-            }
-            for (target, start, fdr, fsc) in zip(
-                train_target_values, m5_dates, train_dynamic_real, stat_cat
-            )
-        ],
-        freq="D",
-    )
 
-    val_ds = ListDataset(
-        [
-            {
-                FieldName.TARGET: target,
-                FieldName.START: start,
-                FieldName.FEAT_DYNAMIC_REAL: fdr,
-                FieldName.FEAT_STATIC_CAT: fsc,
-            }
-            for (target, start, fdr, fsc) in zip(
-                val_target_values, m5_dates, val_dynamic_real, stat_cat
-            )
-        ],
-        freq="D",
+def load_datasets(
+    data_dir: str,
+    compact: bool = False,
+) -> Tuple[M5Dataset, M5Dataset, M5Dataset, List[int]]:
+    """Loads the train, validation and test datasets of M5.
+
+    With ``compact=True`` the datasets use compact dtypes (``int16`` targets,
+    ``float16`` price features and ``int8`` event flags), to be used with
+    ``MyEstimator(compact_dtypes=True)``.
+    """
+    arrays = load_m5_arrays(data_dir, compact=compact)
+
+    dataset = M5Dataset(
+        target=arrays["target"],
+        price_features=arrays["price_features"],
+        calendar_features=arrays["calendar_features"],
+        stat_cat=arrays["stat_cat"],
     )
+    stat_cat_cardinalities = arrays["cardinalities"].tolist()
 
-    test_ds = ListDataset(
-        [
-            {
-                FieldName.TARGET: target,
-                FieldName.START: start,
-                FieldName.FEAT_DYNAMIC_REAL: fdr,
-                FieldName.FEAT_STATIC_CAT: fsc,
-            }
-            for (target, start, fdr, fsc) in zip(
-                test_target_values, m5_dates, test_dynamic_real, stat_cat
-            )
-        ],
-        freq="D",
-    )
+    train_ds = dataset.with_length(dataset.length - 2 * PREDICTION_LENGTH)
+    val_ds = dataset.with_length(dataset.length - PREDICTION_LENGTH)
+    test_ds = dataset
 
     return train_ds, val_ds, test_ds, stat_cat_cardinalities
@@ -0,0 +1,241 @@
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+__all__ = ["generate_m5_dataset"]
+
+# stores per state and number of items per department of the M5 dataset
+M5_STORES = {
+    "CA": ["CA_1", "CA_2", "CA_3", "CA_4"],
+    "TX": ["TX_1", "TX_2", "TX_3"],
+    "WI": ["WI_1", "WI_2", "WI_3"],
+}
+M5_ITEMS_PER_DEPT = {
+    "FOODS": {"FOODS_1": 216, "FOODS_2": 398, "FOODS_3": 823},
+    "HOBBIES": {"HOBBIES_1": 416, "HOBBIES_2": 149},
+    "HOUSEHOLD": {"HOUSEHOLD_1": 532, "HOUSEHOLD_2": 515},
+}
+M5_START = "2011-01-29"
+M5_CALENDAR_DAYS = 1969
+M5_SALES_DAYS = 1941
+# number of items of a store generated and written at once
+ITEM_BLOCK_SIZE = 1024
+
+# (month-day, name, type) of the yearly events
+EVENTS_1 = [
+    ("01-01", "NewYear", "National"),
+    ("02-14", "ValentinesDay", "Cultural"),
+    ("03-17", "StPatricksDay", "Cultural"),
+    ("04-24", "Easter", "Cultural"),
+    ("07-04", "IndependenceDay", "National"),
+    ("10-31", "Halloween", "Cultural"),
+    ("11-24", "Thanksgiving", "National"),
+    ("12-25", "Christmas", "National"),
+]
+EVENTS_2 = [
+    ("04-24", "OrthodoxEaster", "Religious"),
+]
+SNAP_DAYS = {
+    "CA": list(range(1, 11)),
+    "TX": [1, 3, 5, 6, 7, 9, 11, 12, 15],
+    "WI": [2, 3, 5, 6, 8, 9, 11, 12, 14, 15],
+}
+
+
+def _generate_calendar() -> pd.DataFrame:
+    dates = pd.date_range(M5_START, periods=M5_CALENDAR_DAYS, freq="D")
+    weeks = np.arange(M5_CALENDAR_DAYS) // 7
+    month_days = dates.strftime("%m-%d")
+
+    calendar = pd.DataFrame(
+        {
+            "date": dates.strftime("%Y-%m-%d"),
+            "wm_yr_wk": 11101 + 100 * (weeks // 52) + weeks % 52,
+            "weekday": dates.day_name(),
+            "wday": (dates.dayofweek + 2) % 7 + 1,
+            "month": dates.month,
+            "year": dates.year,
+            "d": [f"d_{i}" for i in range(1, M5_CALENDAR_DAYS + 1)],
+        }
+    )
+    for i, events in enumerate([EVENTS_1, EVENTS_2], start=1):
+        names = {month_day: name for month_day, name, _ in events}
+        types = {month_day: event_type for month_day, _, event_type in events}
+        calendar[f"event_name_{i}"] = month_days.map(names)
+        calendar[f"event_type_{i}"] = month_days.map(types)
+    for state, days in SNAP_DAYS.items():
+        calendar[f"snap_{state}"] = np.isin(dates.day, days).astype(np.int64)
+
+    return calendar
+
+
+def _items_per_dept(scale: float) -> Dict[Tuple[str, str], int]:
+    return {
+        (cat_id, dept_id): max(1, int(round(n_items * scale)))
+        for cat_id, depts in M5_ITEMS_PER_DEPT.items()
+        for dept_id, n_items in depts.items()
+    }
+
+
+def _generate_store(
+    rng: np.random.Generator,
+    state_id: str,
+    store_id: str,
+    items: List[Tuple[str, str, str]],
+    calendar: pd.DataFrame,
+    item_price: Any,
+) -> Iterator[Tuple[pd.DataFrame, pd.DataFrame]]:
+    """Yields the sales and sell prices of a store in blocks of items."""
+    weeks = calendar["wm_yr_wk"].values
+    unique_weeks = np.unique(weeks)
+    day_weeks = np.searchsorted(unique_weeks, weeks[:M5_SALES_DAYS])
+
+    # weekly, event and snap effects of every day
+    weekday_effect = np.array([1.3, 1.25, 0.95, 0.9, 0.9, 0.95, 1.1])[
+        calendar["wday"].values[:M5_SALES_DAYS] - 1
+    ]
+    event_effect = np.where(
+        calendar["event_type_1"].isna().values[:M5_SALES_DAYS], 1.0, 0.85
+    )
+    snap_effect = 1.0 + 0.1 * calendar[f"snap_{state_id}"].values[:M5_SALES_DAYS]
+    day_effect = weekday_effect * event_effect * snap_effect
+
+    for start in range(0, len(items), ITEM_BLOCK_SIZE):
+        block = slice(start, start + ITEM_BLOCK_SIZE)
+        yield _generate_items(
+            rng,
+            state_id,
+            store_id,
+            items[block],
+            item_price[block],
+            unique_weeks,
+            day_weeks,
+            day_effect,
+        )
+
+
+def _generate_items(
+    rng: np.random.Generator,
+    state_id: str,
+    store_id: str,
+    items: List[Tuple[str, str, str]],
+    item_price: Any,
+    unique_weeks: Any,
+    day_weeks: Any,
+    day_effect: Any,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    n_items = len(items)
+
+    # items are released at some week and sold from then on
+    release_week = np.where(
+        rng.random(n_items) < 0.7,
+        0,
+        rng.integers(0, len(unique_weeks) - 1, size=n_items),
+    )
+
+    # prices: item base price with store level noise and occasional discounts
+    prices = item_price[:, None] * rng.uniform(0.95, 1.05, size=(n_items, 1))
+    prices = prices * np.where(
+        rng.random((n_items, len(unique_weeks))) < 0.05, 0.8, 1.0
+    )
+    prices = np.round(prices, 2)
+    listed = np.arange(len(unique_weeks))[None, :] >= release_week[:, None]
+
+    item_ids = np.array([item_id for item_id, _, _ in items])
+    price_rows, price_weeks = np.nonzero(listed)
+    sell_prices = pd.DataFrame(
+        {
+            "store_id": store_id,
+            "item_id": item_ids[price_rows],
+            "wm_yr_wk": unique_weeks[price_weeks],
+            "sell_price": prices[price_rows, price_weeks],
+        }
+    )
+
+    # sales: intermittent poisson demand with weekly, event and snap effects
+    rate = rng.lognormal(mean=-0.5, sigma=1.0, size=(n_items, 1)) * day_effect
+    sales = rng.poisson(rate)
+    sales[~listed[:, day_weeks]] = 0
+
+    sales_df = pd.concat(
+        [
+            pd.DataFrame(
+                {
+                    "id": [f"{item_id}_{store_id}_evaluation" for item_id in item_ids],
+                    "item_id": item_ids,
+                    "dept_id": [dept_id for _, dept_id, _ in items],
+                    "cat_id": [cat_id for _, _, cat_id in items],
+                    "store_id": store_id,
+                    "state_id": state_id,
+                }
+            ),
+            pd.DataFrame(
+                sales, columns=[f"d_{i}" for i in range(1, M5_SALES_DAYS + 1)]
+            ),
+        ],
+        axis=1,
+    )
+
+    return sales_df, sell_prices
+
+
+def generate_m5_dataset(
+    data_path: Union[Path, str], scale: float = 1.0, seed: int = 0
+) -> None:
+    """
+    Generates a synthetic dataset in the format of the M5 competition.
+
+    Writes ``calendar.csv``, ``sales_train_evaluation.csv`` and
+    ``sell_prices.csv`` with the same hierarchy of states, stores, categories,
+    departments and items as the original data. The number of items of every
+    department, and thus the number of series, is multiplied by ``scale``
+    (``scale=1.0`` gives the 30,490 series of M5). Files are written in blocks
+    of at most ``ITEM_BLOCK_SIZE`` series of one store, so the sales and price
+    arrays held in memory do not grow with ``scale``; only the item names and
+    base prices do.
+
+    Parameters
+    ----------
+    data_path
+        Directory to write the files to.
+    scale
+        Factor for the number of items per department.
+    seed
+        Seed of the random number generator.
+    """
+    data_path = Path(data_path)
+    data_path.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    calendar = _generate_calendar()
+    calendar.to_csv(data_path / "calendar.csv", index=False)
+
+    items_per_dept = _items_per_dept(scale)
+    width = max(3, len(str(max(items_per_dept.values()))))
+    items = [
+        (f"{dept_id}_{i:0{width}d}", dept_id, cat_id)
+        for (cat_id, dept_id), n_items in items_per_dept.items()
+        for i in range(1, n_items + 1)
+    ]
+    category_price = {"FOODS": 3.0, "HOBBIES": 5.0, "HOUSEHOLD": 6.0}
+    item_price = np.array(
+        [category_price[cat_id] for _, _, cat_id in items]
+    ) * rng.lognormal(mean=0.0, sigma=0.5, size=len(items))
+
+    sales_file = data_path / "sales_train_evaluation.csv"
+    prices_file = data_path / "sell_prices.csv"
+    first = True
+    for state_id, store_ids in M5_STORES.items():
+        for store_id in store_ids:
+            for sales_df, sell_prices in _generate_store(
+                rng, state_id, store_id, items, calendar, item_price
+            ):
+                sales_df.to_csv(
+                    sales_file, index=False, mode="w" if first else "a", header=first
+                )
+                sell_prices.to_csv(
+                    prices_file, index=False, mode="w" if first else "a", header=first
+                )
+                first = False
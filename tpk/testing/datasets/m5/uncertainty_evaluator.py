@@ -0,0 +1,160 @@
+from pathlib import Path
+from typing import Any, Sequence
+
+import numpy as np
+import pandas as pd
+
+from tpk.utils.cache import atomic_path
+
+from .accuracy_evaluator import (
+    ROLL_INDEX_FILES,
+    ROLL_MAT_SOURCES,
+    S_MEMORY_BUDGET,
+    get_s_origins,
+    load_precalculated_data,
+    load_roll_mat,
+    prediction_length,
+    rollup,
+)
+from .cache import ensure_artifact
+
+# Quantiles of the M5 uncertainty competition:
+QUANTILES = [0.005, 0.025, 0.165, 0.25, 0.5, 0.75, 0.835, 0.975, 0.995]
+
+
+def spl_scale_file(prediction_start: int) -> str:
+    return f"ordered_spl_scale_p{prediction_start}.npy"
+
+
+def calculate_and_save_spl_scale(data_path: str, prediction_start: int) -> Any:
+    """Calculates the denominator of the SPL of every aggregate and saves it."""
+    sales = pd.read_csv(data_path + "/sales_train_evaluation.csv")
+    roll_mat_csr, _ = load_roll_mat(data_path)
+
+    scale = get_s_origins(
+        roll_mat_csr, sales, [prediction_start], S_MEMORY_BUDGET, squared=False
+    )[0]
+    with atomic_path(Path(data_path) / spl_scale_file(prediction_start)) as tmp_file:
+        np.save(tmp_file, scale)
+
+    return scale
+
+
+# Function to calculate WSPL:
+def wspl(
+    rolled_up_quantiles: Any,
+    rolled_up_y_true: Any,
+    quantiles: Any,
+    w_scale: Any,
+    level_offsets: Any = None,
+) -> Any:
+    """
+    rolled_up_quantiles - np.array of size (42840 rows, N days, Q quantiles)
+    rolled_up_y_true - np.array of size (42840 rows, N days)
+    quantiles - np.array of size (Q,)
+    w_scale - sales weights divided by the scale: np.array (42840,)
+    level_offsets - first row of every aggregation level in the rollup matrix
+
+    Returns the score, and the scores per aggregation level if
+    ``level_offsets`` is given.
+    """
+    n_days = rolled_up_quantiles.shape[1]
+
+    # pinball loss: u * (y - q) if y >= q, (1 - u) * (q - y) otherwise
+    diff = np.subtract(rolled_up_y_true[:, :, None], rolled_up_quantiles)
+    loss = diff * (quantiles - (diff < 0))
+
+    # weighted SPL of every aggregate, averaged over the quantiles
+    wspl_i = loss.sum(axis=(1, 2)) / (n_days * len(quantiles)) * w_scale
+    score = np.sum(wspl_i) / 12
+    if level_offsets is None:
+        return score
+
+    return score, np.add.reduceat(wspl_i, level_offsets)
+
+
+class WSPLEvaluator:
+    """
+    Scores quantile forecasts of the M5 dataset with the WSPL, the metric of
+    the M5 uncertainty competition.
+
+    The sales weights and the rollup matrix are shared with
+    ``WRMSSEEvaluator``; the scales, the mean absolute daily differences of
+    the aggregates, are cached next to them.
+
+    Parameters
+    ----------
+    data_path
+        Directory with the M5 csv files.
+    prediction_start
+        First day of the forecast horizon, e.g. ``VAL_START``.
+    quantiles
+        Quantile levels of the forecasts (default: the nine quantiles of the
+        M5 uncertainty competition).
+    """
+
+    def __init__(
+        self,
+        data_path: str,
+        prediction_start: int,
+        quantiles: Sequence[float] = QUANTILES,
+    ) -> None:
+        self.data_path = data_path
+        self.prediction_start = prediction_start
+        self.quantiles = np.asarray(quantiles)
+
+        _, W, _, roll_mat_csr = load_precalculated_data(data_path, prediction_start)
+        scale = ensure_artifact(
+            data_path,
+            spl_scale_file(prediction_start),
+            ROLL_MAT_SOURCES,
+            [spl_scale_file(prediction_start)],
+            lambda: calculate_and_save_spl_scale(data_path, prediction_start),
+        )
+        if scale is None:
+            scale = np.load(f"{data_path}/{spl_scale_file(prediction_start)}")
+
+        self.scale = scale
+        self.w = W
+        self.w_scale = W / scale
+        self.roll_mat_csr = roll_mat_csr
+        levels = np.load(f"{data_path}/{ROLL_INDEX_FILES['level']}")
+        self.level_offsets = np.flatnonzero(np.diff(levels, prepend=-1))
+
+        # Ground truth of all aggregates:
+        day_cols = [
+            f"d_{i}"
+            for i in range(prediction_start, prediction_start + prediction_length)
+        ]
+        sales = pd.read_csv(data_path + "/sales_train_evaluation.csv", usecols=day_cols)
+        self.y_true = sales[day_cols].values
+        self.rolled_up_y_true = rollup(roll_mat_csr, self.y_true)
+
+    def evaluate(self, quantile_predictions: Any, per_level: bool = False) -> Any:
+        """Computes the WSPL of an (aggregate x day x quantile) forecast.
+
+        The forecast has to be given for all aggregates of the 12 levels, in
+        the row order of the rollup matrix. Quantiles do not add up, so the
+        quantiles of the bottom level series cannot be rolled up into the
+        quantiles of the aggregates. Returns the score and, if ``per_level``
+        is set, also the scores per aggregation level.
+        """
+        quantile_predictions = np.asarray(quantile_predictions)
+        n_rows, n_days, n_quantiles = quantile_predictions.shape
+        if n_quantiles != len(self.quantiles):
+            raise ValueError(
+                f"Got {n_quantiles} quantiles, expected {len(self.quantiles)}"
+            )
+        if n_rows != len(self.rolled_up_y_true):
+            raise ValueError(
+                f"Got forecasts for {n_rows} rows, expected forecasts for all "
+                f"{len(self.rolled_up_y_true)} aggregates"
+            )
+
+        return wspl(
+            quantile_predictions,
+            self.rolled_up_y_true,
+            self.quantiles,
+            self.w_scale,
+            self.level_offsets if per_level else None,
+        )
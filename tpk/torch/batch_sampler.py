@@ -0,0 +1,310 @@
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import torch
+from gluonts.time_feature import TimeFeature
+
+
+def shared_day_features(
+    data: Any, time_features: List[TimeFeature], use_feat_dynamic_real: bool
+) -> Any:
+    """
+    Returns the (day x feature) ``float32`` matrix of the time features and,
+    if ``use_feat_dynamic_real`` is set, the calendar features of ``data``.
+    """
+    index = pd.period_range(data.start, periods=data.length, freq=data.freq)
+    features = [feat(index)[None] for feat in time_features]
+    if use_feat_dynamic_real:
+        features.append(data.calendar_features[:, : data.length])
+    return np.ascontiguousarray(np.concatenate(features).T, dtype=np.float32)
+
+
+class WindowBatchSampler(torch.utils.data.IterableDataset):  # type: ignore
+    """
+    Yields batches of training windows drawn directly from the arrays of an
+    array-backed dataset such as ``M5Dataset``.
+
+    The (series, split point) pairs of a whole batch are drawn with NumPy and
+    every field is gathered with one fancy indexing operation into an array
+    per batch, instead of slicing one dict per window with
+    ``InstanceSplitter`` and stacking them in the ``DataLoader``. The batches
+    have the fields and layout of ``MyEstimator``'s training transformation
+    followed by the ``InstanceSplitter``, with ``float32`` values.
+
+    Split points are drawn uniformly from the days leaving ``future_length``
+    days after them, as ``ExpectedNumInstanceSampler`` does for series of
+    equal length, and past windows reaching before the first day are padded
+    with ``dummy_value``.
+
+    Parameters
+    ----------
+    data
+        Dataset with the arrays ``target`` (series x days), ``price_features``
+        (series x features x days), ``calendar_features`` (features x days)
+        and ``stat_cat`` (series x features), and the attributes ``length``,
+        ``start`` and ``freq``.
+    past_length
+        Length of the past windows.
+    future_length
+        Length of the future windows.
+    batch_size
+        Number of windows per batch.
+    time_features
+        Time features added before the dynamic features.
+    dummy_value
+        Value of the padded days.
+    use_feat_dynamic_real
+        Whether to add the price and calendar features to the time features.
+    use_feat_static_cat
+        Whether to use ``stat_cat`` as static features, otherwise all windows
+        get the single static feature 0.
+    """
+
+    def __init__(
+        self,
+        data: Any,
+        *,
+        past_length: int,
+        future_length: int,
+        batch_size: int,
+        time_features: List[TimeFeature],
+        dummy_value: float = 0.0,
+        use_feat_dynamic_real: bool = True,
+        use_feat_static_cat: bool = True,
+    ) -> None:
+        self.target = data.target
+        self.price_features = data.price_features if use_feat_dynamic_real else None
+        self.stat_cat = np.asarray(
+            data.stat_cat if use_feat_static_cat else np.zeros((len(data), 1)),
+            dtype=np.int64,
+        )
+        self.length = data.length
+        self.past_length = past_length
+        self.future_length = future_length
+        self.batch_size = batch_size
+        self.dummy_value = dummy_value
+
+        # features shared by all series, as (day x feature) rows to gather days
+        self.num_time_features = len(time_features)
+        self.shared_features = shared_day_features(
+            data, time_features, use_feat_dynamic_real
+        )
+
+    def sample_batch(self) -> Dict[str, torch.Tensor]:
+        """Draws the windows of one batch."""
+        series = np.random.randint(len(self.target), size=self.batch_size)
+        split_points = np.random.randint(
+            self.length - self.future_length + 1, size=self.batch_size
+        )
+        return self.gather_batch(series, split_points)
+
+    def gather_batch(self, series: Any, split_points: Any) -> Dict[str, torch.Tensor]:
+        """Gathers the windows of ``series`` split at ``split_points``."""
+        past_days = split_points[:, None] + np.arange(-self.past_length, 0)
+        future_days = split_points[:, None] + np.arange(self.future_length)
+
+        is_pad = past_days < 0
+        np.maximum(past_days, 0, out=past_days)
+        past_target, past_observed_values, past_time_feat = self._gather(
+            series, past_days
+        )
+        for values in [past_target, past_observed_values, past_time_feat]:
+            values[is_pad] = self.dummy_value
+
+        future_target, future_observed_values, future_time_feat = self._gather(
+            series, future_days
+        )
+
+        return {
+            name: torch.from_numpy(value)
+            for name, value in {
+                "feat_static_cat": self.stat_cat[series],
+                "feat_static_real": np.zeros((len(series), 1), dtype=np.float32),
+                "past_time_feat": past_time_feat,
+                "past_target": past_target,
+                "past_observed_values": past_observed_values,
+                "future_time_feat": future_time_feat,
+                "future_target": future_target,
+                "future_observed_values": future_observed_values,
+            }.items()
+        }
+
+    def _gather(self, series: Any, days: Any) -> Tuple[Any, Any, Any]:
+        target = np.empty(days.shape, dtype=np.float32)
+        target[:] = self.target[series[:, None], days]
+        observed_values = np.ones(days.shape, dtype=np.float32)
+        if self.target.dtype.kind == "f":
+            is_nan = np.isnan(target)
+            observed_values[is_nan] = 0.0
+            target[is_nan] = 0.0
+
+        # time features, price features and calendar features of every day
+        num_time = self.num_time_features
+        num_price = 0 if self.price_features is None else self.price_features.shape[1]
+        time_feat = np.empty(
+            days.shape + (self.shared_features.shape[1] + num_price,),
+            dtype=np.float32,
+        )
+        time_feat[..., :num_time] = self.shared_features[days, :num_time]
+        if self.price_features is not None:
+            time_feat[..., num_time : num_time + num_price] = self.price_features[
+                series[:, None], :, days
+            ]
+            time_feat[..., num_time + num_price :] = self.shared_features[
+                days, num_time:
+            ]
+
+        return target, observed_values, time_feat
+
+    def __iter__(self) -> Iterator[Dict[str, torch.Tensor]]:
+        while True:
+            yield self.sample_batch()
+
+
+class DeviceWindowSampler:
+    """
+    Yields batches of training windows sliced on the training device from the
+    arrays of an array-backed dataset such as ``M5Dataset``.
+
+    The target, observed values and price features of all series are copied
+    once into one contiguous (series x day x channel) tensor on ``device``,
+    the time and calendar features into one (day x feature) tensor, both
+    padded with ``past_length`` days of ``dummy_value`` in front. Batches are
+    then gathered from ``unfold`` views of these tensors, without a
+    ``DataLoader`` and without copying data to the device. The batches are
+    those of ``WindowBatchSampler``.
+
+    Parameters
+    ----------
+    data
+        Dataset with the arrays described in ``WindowBatchSampler``.
+    past_length
+        Length of the past windows.
+    future_length
+        Length of the future windows.
+    batch_size
+        Number of windows per batch.
+    time_features
+        Time features added before the dynamic features.
+    dummy_value
+        Value of the padded days.
+    use_feat_dynamic_real
+        Whether to add the price and calendar features to the time features.
+    use_feat_static_cat
+        Whether to use ``stat_cat`` as static features, otherwise all windows
+        get the single static feature 0.
+    device
+        Device of the tensors and batches.
+    """
+
+    def __init__(
+        self,
+        data: Any,
+        *,
+        past_length: int,
+        future_length: int,
+        batch_size: int,
+        time_features: List[TimeFeature],
+        dummy_value: float = 0.0,
+        use_feat_dynamic_real: bool = True,
+        use_feat_static_cat: bool = True,
+        device: Optional[torch.device] = None,
+    ) -> None:
+        self.past_length = past_length
+        self.future_length = future_length
+        self.batch_size = batch_size
+        self.num_time_features = len(time_features)
+        self.device = torch.device("cpu") if device is None else device
+        num_series, length = len(data), data.length
+        self.num_split_points = length - future_length + 1
+
+        # target, observed values and price features of every series and day
+        num_price = data.price_features.shape[1] if use_feat_dynamic_real else 0
+        series_features = np.full(
+            (num_series, past_length + length, 2 + num_price),
+            dummy_value,
+            dtype=np.float32,
+        )
+        target = series_features[:, past_length:, 0]
+        target[:] = data.target[:, :length]
+        is_nan = np.isnan(target)
+        target[is_nan] = 0.0
+        series_features[:, past_length:, 1] = ~is_nan
+        if use_feat_dynamic_real:
+            series_features[:, past_length:, 2:] = np.moveaxis(
+                data.price_features[:, :, :length], 1, 2
+            )
+
+        day_features = shared_day_features(data, time_features, use_feat_dynamic_real)
+        shared_features = np.full(
+            (past_length + length, day_features.shape[1]),
+            dummy_value,
+            dtype=np.float32,
+        )
+        shared_features[past_length:] = day_features
+
+        self.series_features = torch.from_numpy(series_features).to(self.device)
+        self.shared_features = torch.from_numpy(shared_features).to(self.device)
+        self.stat_cat = torch.as_tensor(
+            np.asarray(
+                data.stat_cat if use_feat_static_cat else np.zeros((num_series, 1)),
+                dtype=np.int64,
+            ),
+            device=self.device,
+        )
+        self.feat_static_real = torch.zeros(
+            (batch_size, 1), dtype=torch.float32, device=self.device
+        )
+
+        # (series x split point x channel x day) and (split point x feature x
+        # day) views of all windows
+        window_length = past_length + future_length
+        self.series_windows = self.series_features.unfold(1, window_length, 1)
+        self.shared_windows = self.shared_features.unfold(0, window_length, 1)
+
+    def sample_batch(self) -> Dict[str, torch.Tensor]:
+        """Draws the windows of one batch."""
+        series = torch.randint(
+            len(self.series_features), (self.batch_size,), device=self.device
+        )
+        split_points = torch.randint(
+            self.num_split_points, (self.batch_size,), device=self.device
+        )
+        return self.gather_batch(series, split_points)
+
+    def gather_batch(self, series: Any, split_points: Any) -> Dict[str, torch.Tensor]:
+        """Gathers the windows of ``series`` split at ``split_points``."""
+        # windows start past_length days before the split points, which are
+        # shifted by the same padding
+        series_windows = self.series_windows[series, split_points].transpose(1, 2)
+        shared_windows = self.shared_windows[split_points].transpose(1, 2)
+
+        num_time = self.num_time_features
+        time_feat = torch.cat(
+            [
+                shared_windows[..., :num_time],
+                series_windows[..., 2:],
+                shared_windows[..., num_time:],
+            ],
+            dim=-1,
+        )
+        target = series_windows[..., 0]
+        observed_values = series_windows[..., 1]
+
+        past = slice(None, self.past_length)
+        future = slice(self.past_length, None)
+        return {
+            "feat_static_cat": self.stat_cat[series],
+            "feat_static_real": self.feat_static_real[: len(series)],
+            "past_time_feat": time_feat[:, past].contiguous(),
+            "past_target": target[:, past].contiguous(),
+            "past_observed_values": observed_values[:, past].contiguous(),
+            "future_time_feat": time_feat[:, future].contiguous(),
+            "future_target": target[:, future].contiguous(),
+            "future_observed_values": observed_values[:, future].contiguous(),
+        }
+
+    def __iter__(self) -> Iterator[Dict[str, torch.Tensor]]:
+        while True:
+            yield self.sample_batch()
@@ -0,0 +1,68 @@
+from typing import Any, Iterable
+
+import lightning.pytorch as pl
+import numpy as np
+import torch
+
+WRMSSE_METRIC = "val_wrmsse"
+
+
+class WRMSSECallback(pl.Callback):
+    """
+    Logs the WRMSSE of the predicted distribution means on the validation
+    windows.
+
+    The means are computed directly with the trained network, without building
+    a predictor, at the end of validation every ``every_n_epochs`` epochs.
+
+    Parameters
+    ----------
+    evaluator
+        Object scoring a (series x day) forecast matrix with its ``evaluate``
+        method, e.g. the ``WRMSSEEvaluator`` of the validation horizon.
+    data_loader
+        Batches of network inputs with one validation window per series, in
+        the order of the series of ``evaluator``.
+    every_n_epochs
+        Number of epochs between evaluations (default: 1).
+    name
+        Name of the logged metric (default: ``"val_wrmsse"``).
+    """
+
+    def __init__(
+        self,
+        evaluator: Any,
+        data_loader: Iterable[Any],
+        every_n_epochs: int = 1,
+        name: str = WRMSSE_METRIC,
+    ) -> None:
+        self.evaluator = evaluator
+        self.data_loader = data_loader
+        self.every_n_epochs = every_n_epochs
+        self.name = name
+
+    def on_validation_epoch_end(
+        self, trainer: pl.Trainer, pl_module: pl.LightningModule
+    ) -> None:
+        # same condition as ModelCheckpoint(every_n_epochs=...)
+        if (
+            trainer.sanity_checking
+            or (trainer.current_epoch + 1) % self.every_n_epochs != 0
+        ):
+            return
+
+        model: Any = pl_module.model
+        means = []
+        with torch.no_grad():
+            for batch in self.data_loader:
+                distr_args, loc, scale = model(
+                    **{
+                        name: batch[name].to(pl_module.device)
+                        for name in model.input_shapes()
+                    }
+                )
+                distr = model.distr_output.distribution(distr_args, loc, scale)
+                means.append(distr.mean.cpu().numpy())
+
+        score = self.evaluator.evaluate(np.concatenate(means))
+        pl_module.log(self.name, float(score), prog_bar=True)
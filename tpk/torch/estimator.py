@@ -1,7 +1,20 @@
 import logging
-from typing import Any, Dict, Iterator, List, Optional, Type
+from dataclasses import dataclass
+from itertools import islice
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+)
 
 import lightning.pytorch as pl
+import numpy as np
 import torch
 from gluonts.core.component import validated
 from gluonts.dataset.common import Dataset
@@ -24,7 +37,6 @@ from gluonts.torch.model.predictor import PyTorchPredictor
 from gluonts.torch.modules.loss import DistributionLoss, NegativeLogLikelihood
 from gluonts.transform import (
     AddObservedValuesIndicator,
-    AddTimeFeatures,
     AsNumpyArray,
     Chain,
     ExpectedNumInstanceSampler,
@@ -34,15 +46,21 @@ from gluonts.transform import (
     SetField,
     TestSplitSampler,
     Transformation,
+    TransformedDataset,
     ValidationSplitSampler,
     VstackFeatures,
 )
 from gluonts.transform.sampler import InstanceSampler
 from lightning import LightningModule
 from lightning.pytorch.tuner.tuning import Tuner
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, default_collate
 
+from .batch_sampler import DeviceWindowSampler, WindowBatchSampler
+from .callbacks import WRMSSE_METRIC, WRMSSECallback
 from .lightning_module import MyLightningModule
+from .prefetch import BatchPrefetcher
+from .transform import AddSharedTimeFeatures, AsCompactNumpyArray
+from .transform_cache import cached_transformation
 
 logger = logging.getLogger(__name__)
 
@@ -69,6 +87,140 @@ class IterableDataset(torch.utils.data.IterableDataset):  # type: ignore
         yield from self.iterable
 
 
+@dataclass
+class ShardedDataset:
+    """Every ``num_shards``-th entry of ``data``, starting at ``index``."""
+
+    data: Dataset
+    index: int
+    num_shards: int
+
+    def __iter__(self) -> Iterator[Any]:
+        yield from islice(self.data, self.index, None, self.num_shards)
+
+    def __len__(self) -> int:
+        return len(range(self.index, len(self.data), self.num_shards))
+
+
+def shard_dataset(data: Dataset, index: int, num_shards: int) -> Dataset:
+    """
+    Returns the ``index``-th of ``num_shards`` disjoint shards of the series in
+    ``data``.
+
+    Transformed and cached datasets are sharded below the transformation, so
+    every shard transforms and caches only its own series.
+    """
+    if isinstance(data, TransformedDataset):
+        return TransformedDataset(
+            shard_dataset(data.base_dataset, index, num_shards),
+            data.transformation,
+            is_train=data.is_train,
+        )
+    if isinstance(data, Cached):
+        return Cached(shard_dataset(data.iterable, index, num_shards))
+    return ShardedDataset(data, index, num_shards)
+
+
+class ShardedIterableDataset(torch.utils.data.IterableDataset):  # type: ignore
+    """
+    Yields the instances created by ``create_instances`` from the series of
+    the current ``DataLoader`` worker.
+
+    Every worker gets a disjoint shard of the series, so workers yield
+    distinct instances instead of replaying the same stream. The workers'
+    ``numpy`` and ``random`` states, and with them the instance samplers, are
+    seeded differently by the ``DataLoader``.
+    """
+
+    def __init__(
+        self, data: Dataset, create_instances: Callable[[Dataset], Iterable[Any]]
+    ):
+        self.data = data
+        self.create_instances = create_instances
+        self.shard: Optional[Dataset] = None
+
+    def __iter__(self) -> Any:
+        # every worker has its own copy of the dataset, the shard is kept in it
+        # so a cached shard is reused by persistent workers
+        if self.shard is None:
+            worker_info = torch.utils.data.get_worker_info()
+            if worker_info is not None and worker_info.num_workers > 1:
+                self.shard = shard_dataset(
+                    self.data, worker_info.id, worker_info.num_workers
+                )
+            else:
+                self.shard = self.data
+        yield from self.create_instances(self.shard)
+
+
+def collate_as_float32(instances: List[Dict[str, Any]]) -> Dict[str, torch.Tensor]:
+    """
+    Collates instances into a batch and casts all fields except
+    ``feat_static_cat`` to ``float32``.
+    """
+    batch = default_collate(instances)
+    return {
+        name: value if name == "feat_static_cat" else value.float()
+        for name, value in batch.items()
+    }
+
+
+class ArenaCollate:
+    """
+    Collates instances into batches written to reusable fixed-shape buffers.
+
+    ``num_buffers`` sets of buffers of the shapes ``shapes`` are allocated on
+    first use, separately in every ``DataLoader`` worker, and handed out in
+    rotation, so collating does not allocate tensors once all buffers exist.
+    A batch may be used until ``num_buffers - 1`` further batches were
+    collated by the same process, which must cover the batches queued by the
+    ``DataLoader`` (``prefetch_factor`` per worker) and the ones in use.
+    Smaller batches get views of the buffers. Values are cast to ``dtypes``
+    while they are copied.
+
+    Parameters
+    ----------
+    shapes
+        Shape of every field of a full batch.
+    dtypes
+        Type of every field.
+    num_buffers
+        Number of batches in rotation (default: 6).
+    """
+
+    def __init__(
+        self,
+        shapes: Dict[str, Tuple[int, ...]],
+        dtypes: Dict[str, torch.dtype],
+        num_buffers: int = 6,
+    ) -> None:
+        self.shapes = shapes
+        self.dtypes = dtypes
+        self.num_buffers = num_buffers
+        self.buffers: Optional[List[Dict[str, torch.Tensor]]] = None
+        self.next_buffer = 0
+
+    def __call__(self, instances: List[Dict[str, Any]]) -> Dict[str, torch.Tensor]:
+        if self.buffers is None:
+            self.buffers = [
+                {
+                    name: torch.empty(shape, dtype=self.dtypes[name])
+                    for name, shape in self.shapes.items()
+                }
+                for _ in range(self.num_buffers)
+            ]
+        buffer = self.buffers[self.next_buffer]
+        self.next_buffer = (self.next_buffer + 1) % self.num_buffers
+
+        batch = {}
+        for name, value in buffer.items():
+            batch[name] = value[: len(instances)]
+            np.stack(
+                [instance[name] for instance in instances], out=batch[name].numpy()
+            )
+        return batch
+
+
 class MyEstimator(PyTorchLightningEstimator):  # type: ignore
     """
     Estimator class to train a TPK model.
@@ -131,6 +283,53 @@ class MyEstimator(PyTorchLightningEstimator):  # type: ignore
         Controls the sampling of windows during training.
     validation_sampler
         Controls the sampling of windows during validation.
+    compact_dtypes
+        Whether the data is stored in compact dtypes (e.g. ``int16`` targets),
+        which are then kept through the transformation and cast to ``float32``
+        per batch when collating (default: False).
+    validation_evaluator
+        Evaluator scoring the forecast means of the validation windows with
+        its ``evaluate`` method, e.g. the ``WRMSSEEvaluator`` of the validation
+        horizon. If set, the score is logged as ``val_wrmsse`` during training
+        (default: None).
+    validation_every_n_epochs
+        Number of epochs between evaluations with ``validation_evaluator``
+        (default: 1).
+    checkpoint_monitor
+        Metric used to select the best checkpoint (default: ``val_wrmsse`` if
+        ``validation_evaluator`` is set, otherwise ``val_loss``, or
+        ``train_loss`` without validation data).
+    num_workers
+        Number of ``DataLoader`` worker processes creating the training and
+        validation batches, each from its own shard of the series; 0 creates
+        them in the main process (default: 2).
+    use_array_sampler
+        Whether to draw the training windows of a whole batch at once from the
+        arrays of an array-backed dataset such as ``M5Dataset``, see
+        ``WindowBatchSampler``, instead of transforming and splitting the
+        series one by one; ``train_sampler`` is not used then
+        (default: False).
+    device_resident
+        Whether to copy all training series of an array-backed dataset to the
+        training device once and slice the training windows there, see
+        ``DeviceWindowSampler``, without a ``DataLoader``; ``train_sampler``
+        and ``num_workers`` are not used for training then (default: False).
+    prefetch_batches
+        Number of training batches prepared ahead of the training step by a
+        background thread in reused (pinned, if CUDA is available) buffers,
+        see ``BatchPrefetcher``; 0 disables prefetching. Not used with
+        ``device_resident`` (default: 0).
+    reuse_batch_buffers
+        Whether to collate the training and validation batches into reused
+        buffers sized from the model inputs, see ``ArenaCollate``, instead of
+        new tensors per batch (default: False).
+    transformation_cache_dir
+        Directory in which the transformed training and validation data are
+        written once per transformation and dataset and memory-mapped by
+        later runs, see ``cached_transformation``; ``cache_data`` is not used
+        then. Copies written by other versions are removed, but every other
+        transformation or dataset adds a copy of its transformed data. By
+        default the data are transformed in every run.
     """
 
     @validated()  # type: ignore
@@ -164,6 +363,16 @@ class MyEstimator(PyTorchLightningEstimator):  # type: ignore
         train_sampler: Optional[InstanceSampler] = None,
         validation_sampler: Optional[InstanceSampler] = None,
         use_one_cycle: bool = False,
+        compact_dtypes: bool = False,
+        validation_evaluator: Optional[Any] = None,
+        validation_every_n_epochs: int = 1,
+        checkpoint_monitor: Optional[str] = None,
+        num_workers: int = 2,
+        use_array_sampler: bool = False,
+        device_resident: bool = False,
+        prefetch_batches: int = 0,
+        reuse_batch_buffers: bool = False,
+        transformation_cache_dir: Optional[str] = None,
     ) -> None:
         default_trainer_kwargs = {
             "max_epochs": 100,
@@ -213,6 +422,16 @@ class MyEstimator(PyTorchLightningEstimator):  # type: ignore
         self.validation_sampler = validation_sampler or ValidationSplitSampler(
             min_future=prediction_length
         )
+        self.compact_dtypes = compact_dtypes
+        self.validation_evaluator = validation_evaluator
+        self.validation_every_n_epochs = validation_every_n_epochs
+        self.checkpoint_monitor = checkpoint_monitor
+        self.num_workers = num_workers
+        self.use_array_sampler = use_array_sampler
+        self.device_resident = device_resident
+        self.prefetch_batches = prefetch_batches
+        self.reuse_batch_buffers = reuse_batch_buffers
+        self.transformation_cache_dir = transformation_cache_dir
 
     def create_transformation(self) -> Transformation:
         remove_field_names = []
@@ -243,7 +462,7 @@ class MyEstimator(PyTorchLightningEstimator):  # type: ignore
                     field=FieldName.FEAT_STATIC_REAL,
                     expected_ndim=1,
                 ),
-                AsNumpyArray(
+                (AsCompactNumpyArray if self.compact_dtypes else AsNumpyArray)(
                     field=FieldName.TARGET,
                     # in the following line, we add 1 for the time dimension
                     expected_ndim=1 + len(self.distr_output.event_shape),
@@ -252,7 +471,7 @@ class MyEstimator(PyTorchLightningEstimator):  # type: ignore
                     target_field=FieldName.TARGET,
                     output_field=FieldName.OBSERVED_VALUES,
                 ),
-                AddTimeFeatures(
+                AddSharedTimeFeatures(
                     start_field=FieldName.START,
                     target_field=FieldName.TARGET,
                     output_field=FieldName.FEAT_TIME,
@@ -305,27 +524,125 @@ class MyEstimator(PyTorchLightningEstimator):  # type: ignore
         shuffle_buffer_length: Optional[int] = None,
         **kwargs: Any,
     ) -> Any:
+        if self.device_resident:
+            return self.create_device_training_data_loader(data)
+        if self.use_array_sampler:
+            return self.create_array_training_data_loader(data, **kwargs)
+
         transformation = self._create_instance_splitter(
             module, "training"
         ) + SelectFields(TRAINING_INPUT_NAMES)
 
-        training_instances = transformation.apply(
-            Cyclic(data)
-            if shuffle_buffer_length is None
-            else PseudoShuffled(
-                Cyclic(data), shuffle_buffer_length=shuffle_buffer_length
+        def create_training_instances(data: Dataset) -> Any:
+            return transformation.apply(
+                Cyclic(data)
+                if shuffle_buffer_length is None
+                else PseudoShuffled(
+                    Cyclic(data), shuffle_buffer_length=shuffle_buffer_length
+                )
             )
+
+        return IterableSlice(
+            self._prefetch(
+                iter(
+                    # nosemgrep
+                    DataLoader(
+                        ShardedIterableDataset(data, create_training_instances),
+                        batch_size=self.batch_size,
+                        num_workers=self.num_workers,
+                        persistent_workers=self.num_workers > 0,
+                        collate_fn=self._create_collate(module),
+                        **kwargs,
+                    )
+                )
+            ),
+            self.num_batches_per_epoch,
         )
 
+    def create_array_training_data_loader(self, data: Any, **kwargs: Any) -> Any:
+        """
+        Creates the training batches with a ``WindowBatchSampler`` over the
+        arrays of the untransformed ``data``.
+        """
+        return IterableSlice(
+            self._prefetch(
+                iter(
+                    # nosemgrep
+                    DataLoader(
+                        WindowBatchSampler(
+                            data,
+                            past_length=self.context_length,
+                            future_length=self.prediction_length,
+                            batch_size=self.batch_size,
+                            time_features=self.time_features,
+                            dummy_value=self.distr_output.value_in_support,
+                            use_feat_dynamic_real=self.num_feat_dynamic_real > 0,
+                            use_feat_static_cat=self.num_feat_static_cat > 0,
+                        ),
+                        batch_size=None,
+                        num_workers=self.num_workers,
+                        persistent_workers=self.num_workers > 0,
+                        **kwargs,
+                    )
+                )
+            ),
+            self.num_batches_per_epoch,
+        )
+
+    def _create_collate(self, module: LightningModule) -> Any:
+        if not self.reuse_batch_buffers:
+            return collate_as_float32 if self.compact_dtypes else None
+
+        model: Any = module.model
+        shapes = model.input_shapes(self.batch_size)
+        dtypes = model.input_types()
+        for name in ["future_target", "future_observed_values"]:
+            shapes[name] = (self.batch_size, self.prediction_length)
+            dtypes[name] = torch.float
+        return ArenaCollate(shapes, dtypes)
+
+    def _transform(
+        self, transformation: Transformation, data: Dataset, cache_data: bool
+    ) -> Dataset:
+        if self.transformation_cache_dir is not None:
+            return cached_transformation(
+                self.transformation_cache_dir, transformation, data, is_train=True
+            )
+
+        transformed_data: Dataset = transformation.apply(data, is_train=True)
+        return Cached(transformed_data) if cache_data else transformed_data
+
+    def _prefetch(self, batches: Iterator[Any]) -> Iterator[Any]:
+        if self.prefetch_batches == 0:
+            return batches
+        return BatchPrefetcher(batches, num_prefetch=self.prefetch_batches)
+
+    def _close_prefetcher(self, data_loader: Any) -> None:
+        # stops the background thread also if training failed or was interrupted
+        if isinstance(data_loader.iterable, BatchPrefetcher):
+            data_loader.iterable.log_stats()
+            data_loader.iterable.close()
+
+    def create_device_training_data_loader(self, data: Any) -> Any:
+        """
+        Creates the training batches with a ``DeviceWindowSampler`` holding
+        the arrays of the untransformed ``data`` on the training device.
+        """
+        accelerator = self.trainer_kwargs.get("accelerator", "auto")
+        use_cuda = torch.cuda.is_available() and accelerator in ["auto", "gpu", "cuda"]
+
         return IterableSlice(
             iter(
-                # nosemgrep
-                DataLoader(
-                    IterableDataset(training_instances),
+                DeviceWindowSampler(
+                    data,
+                    past_length=self.context_length,
+                    future_length=self.prediction_length,
                     batch_size=self.batch_size,
-                    num_workers=2,
-                    persistent_workers=True,
-                    **kwargs,
+                    time_features=self.time_features,
+                    dummy_value=self.distr_output.value_in_support,
+                    use_feat_dynamic_real=self.num_feat_dynamic_real > 0,
+                    use_feat_static_cat=self.num_feat_static_cat > 0,
+                    device=torch.device("cuda" if use_cuda else "cpu"),
                 )
             ),
             self.num_batches_per_epoch,
@@ -341,14 +658,38 @@ class MyEstimator(PyTorchLightningEstimator):  # type: ignore
             module, "validation"
         ) + SelectFields(TRAINING_INPUT_NAMES)
 
+        # nosemgrep
+        return DataLoader(
+            ShardedIterableDataset(data, transformation.apply),
+            batch_size=self.batch_size,
+            num_workers=self.num_workers,
+            persistent_workers=self.num_workers > 0,
+            collate_fn=self._create_collate(module),
+            **kwargs,
+        )
+
+    def create_validation_forecast_data_loader(
+        self,
+        data: Dataset,
+        module: LightningModule,
+        **kwargs: Any,
+    ) -> DataLoader:  # type: ignore
+        """
+        Creates batches of the network inputs of the validation windows, one
+        per series and in the order of ``data``, to compute forecasts during
+        training.
+        """
+        transformation = self._create_instance_splitter(
+            module, "validation"
+        ) + SelectFields(PREDICTION_INPUT_NAMES)
+
         validation_instances = transformation.apply(data)
 
         # nosemgrep
         return DataLoader(
             IterableDataset(validation_instances),
             batch_size=self.batch_size,
-            num_workers=2,
-            persistent_workers=True,
+            collate_fn=collate_as_float32 if self.compact_dtypes else None,
             **kwargs,
         )
 
@@ -394,8 +735,15 @@ class MyEstimator(PyTorchLightningEstimator):  # type: ignore
     ) -> PyTorchPredictor:
         prediction_splitter = self._create_instance_splitter(module, "test")
 
+        input_transform = transformation + prediction_splitter
+        if self.compact_dtypes:
+            input_transform += AsNumpyArray(
+                field=f"past_{FieldName.TARGET}",
+                expected_ndim=1 + len(self.distr_output.event_shape),
+            )
+
         return PyTorchPredictor(
-            input_transform=transformation + prediction_splitter,
+            input_transform=input_transform,
             input_names=PREDICTION_INPUT_NAMES,
             prediction_net=module,
             forecast_generator=DistributionForecastGenerator(self.distr_output),
@@ -417,16 +765,15 @@ class MyEstimator(PyTorchLightningEstimator):  # type: ignore
         transformation = self.create_transformation()
 
         with env._let(max_idle_transforms=max(len(training_data), 100)):
-            transformed_training_data: Dataset = transformation.apply(
-                training_data, is_train=True
-            )
-            if cache_data:
-                transformed_training_data = Cached(transformed_training_data)
-
             training_network = self.create_lightning_module()
 
             training_data_loader = self.create_training_data_loader(
-                transformed_training_data,
+                # the array samplers read the untransformed arrays
+                (
+                    training_data
+                    if self.use_array_sampler or self.device_resident
+                    else self._transform(transformation, training_data, cache_data)
+                ),
                 training_network,
                 shuffle_buffer_length=shuffle_buffer_length,
             )
@@ -435,11 +782,9 @@ class MyEstimator(PyTorchLightningEstimator):  # type: ignore
 
         if validation_data is not None:
             with env._let(max_idle_transforms=max(len(validation_data), 100)):
-                transformed_validation_data: Dataset = transformation.apply(
-                    validation_data, is_train=True
+                transformed_validation_data = self._transform(
+                    transformation, validation_data, cache_data
                 )
-                if cache_data:
-                    transformed_validation_data = Cached(transformed_validation_data)
 
                 validation_data_loader = self.create_validation_data_loader(
                     transformed_validation_data,
@@ -449,26 +794,52 @@ class MyEstimator(PyTorchLightningEstimator):  # type: ignore
         if from_predictor is not None:
             training_network.load_state_dict(from_predictor.network.state_dict())
 
-        monitor = "train_loss" if validation_data is None else "val_loss"
+        callbacks = []
+        if validation_data is not None and self.validation_evaluator is not None:
+            callbacks.append(
+                WRMSSECallback(
+                    evaluator=self.validation_evaluator,
+                    data_loader=self.create_validation_forecast_data_loader(
+                        transformed_validation_data, training_network
+                    ),
+                    every_n_epochs=self.validation_every_n_epochs,
+                )
+            )
+
+        if self.checkpoint_monitor is not None:
+            monitor = self.checkpoint_monitor
+        elif validation_data is None:
+            monitor = "train_loss"
+        else:
+            monitor = "val_loss" if self.validation_evaluator is None else WRMSSE_METRIC
         checkpoint = pl.callbacks.ModelCheckpoint(
-            monitor=monitor, mode="min", verbose=True
+            monitor=monitor,
+            mode="min",
+            verbose=True,
+            # the WRMSSE is only up to date in the epochs it is computed
+            every_n_epochs=(
+                self.validation_every_n_epochs if monitor == WRMSSE_METRIC else None
+            ),
         )
 
         custom_callbacks = self.trainer_kwargs.pop("callbacks", [])
         trainer = pl.Trainer(
             **{
                 "accelerator": "auto",
-                "callbacks": [checkpoint] + custom_callbacks,
+                "callbacks": [checkpoint] + callbacks + custom_callbacks,
                 **self.trainer_kwargs,
             }
         )
 
-        trainer.fit(
-            model=training_network,
-            train_dataloaders=training_data_loader,
-            val_dataloaders=validation_data_loader,
-            ckpt_path=ckpt_path,
-        )
+        try:
+            trainer.fit(
+                model=training_network,
+                train_dataloaders=training_data_loader,
+                val_dataloaders=validation_data_loader,
+                ckpt_path=ckpt_path,
+            )
+        finally:
+            self._close_prefetcher(training_data_loader)
 
         if checkpoint.best_model_path != "":
             logger.info(f"Loading best model from {checkpoint.best_model_path}")
@@ -498,16 +869,15 @@ class MyEstimator(PyTorchLightningEstimator):  # type: ignore
         transformation = self.create_transformation()
 
         with env._let(max_idle_transforms=max(len(training_data), 100)):
-            transformed_training_data: Dataset = transformation.apply(
-                training_data, is_train=True
-            )
-            if cache_data:
-                transformed_training_data = Cached(transformed_training_data)
-
             training_network = self.create_lightning_module()
 
             training_data_loader = self.create_training_data_loader(
-                transformed_training_data,
+                # the array samplers read the untransformed arrays
+                (
+                    training_data
+                    if self.use_array_sampler or self.device_resident
+                    else self._transform(transformation, training_data, cache_data)
+                ),
                 training_network,
                 shuffle_buffer_length=shuffle_buffer_length,
             )
@@ -516,11 +886,9 @@ class MyEstimator(PyTorchLightningEstimator):  # type: ignore
 
         if validation_data is not None:
             with env._let(max_idle_transforms=max(len(validation_data), 100)):
-                transformed_validation_data: Dataset = transformation.apply(
-                    validation_data, is_train=True
+                transformed_validation_data = self._transform(
+                    transformation, validation_data, cache_data
                 )
-                if cache_data:
-                    transformed_validation_data = Cached(transformed_validation_data)
 
                 validation_data_loader = self.create_validation_data_loader(
                     transformed_validation_data,
@@ -536,11 +904,14 @@ class MyEstimator(PyTorchLightningEstimator):  # type: ignore
 
         tuner = Tuner(trainer)
 
-        tuner.lr_find(
-            model=training_network,
-            train_dataloaders=training_data_loader,
-            val_dataloaders=validation_data_loader,
-            early_stop_threshold=50.0,
-        )
+        try:
+            tuner.lr_find(
+                model=training_network,
+                train_dataloaders=training_data_loader,
+                val_dataloaders=validation_data_loader,
+                early_stop_threshold=50.0,
+            )
+        finally:
+            self._close_prefetcher(training_data_loader)
 
         return training_network.lr
@@ -65,6 +65,7 @@ class MyLightningModule(LightningModule):
         self.steps_per_epoch = steps_per_epoch
         self.lr = lr
         self.use_one_cycle = use_one_cycle
+        self.input_names = list(self.model.input_shapes())  # type: ignore
         self.example_input_array = tuple(
             [
                 torch.zeros(shape, dtype=self.model.input_types()[name])
@@ -83,12 +84,11 @@ class MyLightningModule(LightningModule):
         # assert context.shape[-1] == self.model.context_length
         # assert target.shape[-1] == self.model.prediction_length
 
-        distr_args, loc, scale = self.model(**select(self.model.input_shapes(), batch))
+        distr_args, loc, scale = self.model(**select(self.input_names, batch))
         distr = self.model.distr_output.distribution(distr_args, loc, scale)
 
-        return (self.loss(distr, target) * observed_target).sum() / torch.maximum(  # type: ignore
-            torch.tensor(1.0), observed_target.sum()
-        )
+        loss = (self.loss(distr, target) * observed_target).sum()
+        return loss / observed_target.sum().clamp(min=1.0)  # type: ignore
 
     def training_step(self, batch, batch_idx: int):  # type: ignore
         """
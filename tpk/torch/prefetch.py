@@ -0,0 +1,141 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+class BatchPrefetcher:
+    """
+    Iterator prefetching batches of tensors in a background thread.
+
+    The thread copies up to ``num_prefetch`` batches ahead of the consumer
+    into a ring of preallocated buffers, pinned if ``pin_memory`` is set, so
+    the next batch is assembled while the current training step runs and can
+    be copied to the GPU asynchronously. Buffers are reused once the consumer
+    took ``num_in_use`` more batches, so at most ``num_in_use`` batches
+    returned by the prefetcher may be used at a time; a smaller last batch
+    gets new buffers.
+
+    The number of batches for which the consumer had to wait, and the total
+    waiting time, are kept in ``num_waits`` and ``wait_time``.
+
+    Parameters
+    ----------
+    batches
+        Iterator over dicts of tensors, e.g. an iterator over a ``DataLoader``.
+    num_prefetch
+        Number of batches prepared ahead of the consumer (default: 2).
+    num_in_use
+        Number of batches which may be used at the same time; Lightning keeps
+        one batch ahead of the training step (default: 2).
+    pin_memory
+        Whether the buffers are in pinned memory (default: if CUDA is
+        available).
+    """
+
+    def __init__(
+        self,
+        batches: Iterator[Dict[str, torch.Tensor]],
+        num_prefetch: int = 2,
+        num_in_use: int = 2,
+        pin_memory: Optional[bool] = None,
+    ) -> None:
+        self.batches = batches
+        self.num_prefetch = num_prefetch
+        self.pin_memory = (
+            torch.cuda.is_available() if pin_memory is None else pin_memory
+        )
+        # buffers of the queued batches, the batches in use and the batch
+        # being assembled
+        self.buffers: List[Optional[Dict[str, torch.Tensor]]] = [None] * (
+            num_prefetch + num_in_use + 1
+        )
+        self.queue: "queue.Queue[Any]" = queue.Queue(maxsize=num_prefetch)
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+        self.num_batches = 0
+        self.num_waits = 0
+        self.wait_time = 0.0
+
+    def _buffer(self, index: int, batch: Dict[str, torch.Tensor]) -> Any:
+        buffer = self.buffers[index]
+        if buffer is None or any(
+            buffer[name].shape != value.shape or buffer[name].dtype != value.dtype
+            for name, value in batch.items()
+        ):
+            buffer = {
+                name: torch.empty(
+                    value.shape, dtype=value.dtype, pin_memory=self.pin_memory
+                )
+                for name, value in batch.items()
+            }
+            self.buffers[index] = buffer
+
+        return buffer
+
+    def _put(self, item: Any) -> bool:
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _fill(self) -> None:
+        try:
+            for i, batch in enumerate(self.batches):
+                buffer = self._buffer(i % len(self.buffers), batch)
+                for name, value in batch.items():
+                    buffer[name].copy_(value)
+                if not self._put(buffer):
+                    return
+            self._put(StopIteration())
+        except Exception as e:
+            self._put(e)
+
+    def __iter__(self) -> "BatchPrefetcher":
+        return self
+
+    def __next__(self) -> Dict[str, torch.Tensor]:
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._fill, daemon=True)
+            self.thread.start()
+
+        wait_time = None
+        try:
+            item = self.queue.get_nowait()
+        except queue.Empty:
+            start = time.perf_counter()
+            item = self.queue.get()
+            wait_time = time.perf_counter() - start
+
+        if isinstance(item, BaseException):
+            # the thread stopped, keep raising for further calls
+            self.queue.put(item)
+            raise item
+
+        self.num_batches += 1
+        if wait_time is not None:
+            self.num_waits += 1
+            self.wait_time += wait_time
+        return item  # type: ignore
+
+    def close(self) -> None:
+        """Stops the background thread."""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def log_stats(self) -> None:
+        """Logs how often the consumer had to wait for a batch."""
+        logger.info(
+            f"Waited for {self.num_waits} of {self.num_batches} prefetched batches "
+            f"({self.wait_time:.2f}s in total)"
+        )
@@ -0,0 +1,125 @@
+from collections import OrderedDict
+from typing import Any, List, Type
+
+import numpy as np
+import pandas as pd
+from gluonts.core.component import validated
+from gluonts.dataset.common import DataEntry
+from gluonts.exceptions import assert_data_error
+from gluonts.time_feature import TimeFeature
+from gluonts.transform import MapTransformation, SimpleTransformation
+from gluonts.transform.feature import target_transformation_length
+
+
+class AsCompactNumpyArray(SimpleTransformation):  # type: ignore
+    """
+    Converts the value of a field into a numpy array, keeping the dtype of
+    values which already are integer or floating point numpy arrays.
+
+    Used instead of ``AsNumpyArray`` for data stored in compact dtypes (e.g.
+    ``int16`` targets), which are then cast to ``float32`` per batch instead of
+    per entry.
+
+    Parameters
+    ----------
+    field
+        Field to convert.
+    expected_ndim
+        Expected number of dimensions. Throws an exception if the number of
+        dimensions does not match.
+    """
+
+    @validated()  # type: ignore
+    def __init__(self, field: str, expected_ndim: int) -> None:
+        self.field = field
+        self.expected_ndim = expected_ndim
+
+    def transform(self, data: DataEntry) -> DataEntry:
+        value = data[self.field]
+        if not (isinstance(value, np.ndarray) and value.dtype.kind in "iuf"):
+            value = np.asarray(value, dtype=np.float32)
+
+        assert_data_error(
+            value.ndim == self.expected_ndim,
+            'Input for field "{self.field}" does not have the required'
+            "dimension (field: {self.field}, ndim observed: {value.ndim}, "
+            "expected ndim: {self.expected_ndim})",
+            value=value,
+            self=self,
+        )
+        data[self.field] = value
+        return data
+
+
+class AddSharedTimeFeatures(MapTransformation):  # type: ignore
+    """
+    Adds a set of time features to the data entry, like ``AddTimeFeatures``.
+
+    The time features are computed only once per start date and stored in a
+    read-only buffer covering the longest series seen so far; every entry
+    starting at that date gets a view of the buffer. Series sharing a calendar
+    (e.g. all M5 series) therefore do not recompute the features per entry.
+    Buffers of at most ``max_cached_starts`` different start dates are kept.
+
+    Parameters
+    ----------
+    start_field
+        Field with the start time stamp of the time series
+    target_field
+        Field with the array containing the time series values
+    output_field
+        Field name for result.
+    time_features
+        list of time features to use.
+    pred_length
+        Prediction length
+    max_cached_starts
+        Number of start dates for which the time features are cached.
+    """
+
+    @validated()  # type: ignore
+    def __init__(
+        self,
+        start_field: str,
+        target_field: str,
+        output_field: str,
+        time_features: List[TimeFeature],
+        pred_length: int,
+        max_cached_starts: int = 16,
+        dtype: Type = np.float32,  # type: ignore
+    ) -> None:
+        self.date_features = time_features
+        self.pred_length = pred_length
+        self.start_field = start_field
+        self.target_field = target_field
+        self.output_field = output_field
+        self.max_cached_starts = max_cached_starts
+        self.dtype = dtype
+        self._buffers: "OrderedDict[Any, Any]" = OrderedDict()
+
+    def _time_features(self, start: pd.Period, length: int) -> Any:
+        buffer = self._buffers.get(start)
+        if buffer is None or buffer.shape[1] < length:
+            index = pd.period_range(start, periods=length, freq=start.freq)
+            buffer = np.vstack([feat(index) for feat in self.date_features]).astype(
+                self.dtype
+            )
+            buffer.flags.writeable = False
+
+            self._buffers[start] = buffer
+            if len(self._buffers) > self.max_cached_starts:
+                self._buffers.popitem(last=False)
+
+        return buffer[:, :length]
+
+    def map_transform(self, data: DataEntry, is_train: bool) -> DataEntry:
+        if not self.date_features:
+            data[self.output_field] = None
+            return data
+
+        length = target_transformation_length(
+            data[self.target_field], self.pred_length, is_train=is_train
+        )
+        data[self.output_field] = self._time_features(data[self.start_field], length)
+
+        return data
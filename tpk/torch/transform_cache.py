@@ -0,0 +1,250 @@
+import hashlib
+import json
+import os
+import shutil
+from importlib.metadata import version
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from gluonts.core import serde
+from gluonts.dataset.common import DataEntry, Dataset
+from gluonts.dataset.field_names import FieldName
+from gluonts.transform import Transformation
+
+from tpk.__about__ import __version__
+from tpk.utils.cache import artifact_lock
+
+# written last, a cache directory with this file is complete
+METADATA_FILE = "metadata.json"
+# part of every cache key, to be increased when the cache layout or the code of
+# the transformations changes the transformed data
+CACHE_FORMAT_VERSION = 1
+
+
+def dataset_fingerprint(data: Dataset) -> str:
+    """
+    Returns a hash of the content of ``data``.
+
+    Datasets with a ``fingerprint`` method, such as ``M5Dataset``, are hashed
+    by it; all other datasets are hashed entry by entry.
+    """
+    if hasattr(data, "fingerprint"):
+        return data.fingerprint()  # type: ignore
+
+    digest = hashlib.blake2b(digest_size=16)
+    for entry in data:
+        for name in sorted(entry):
+            value = entry[name]
+            digest.update(name.encode())
+            if isinstance(value, np.ndarray):
+                digest.update(f"{value.dtype}{value.shape}".encode())
+                digest.update(np.ascontiguousarray(value).data)
+            else:
+                digest.update(repr(value).encode())
+    return digest.hexdigest()
+
+
+def cache_versions() -> str:
+    """Returns the versions the transformed data in a cache depend on."""
+    return f"{CACHE_FORMAT_VERSION} {__version__} {version('gluonts')}"
+
+
+def transformation_key(
+    transformation: Transformation, data: Dataset, is_train: bool
+) -> str:
+    """
+    Returns the cache key of ``transformation`` applied to ``data``.
+
+    The key also covers ``cache_versions``, so changed transformation code
+    does not read stale caches.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(cache_versions().encode())
+    digest.update(serde.dump_json(transformation).encode())
+    digest.update(dataset_fingerprint(data).encode())
+    digest.update(str(is_train).encode())
+    return digest.hexdigest()
+
+
+def save_transformed_dataset(path: Path, entries: Iterator[DataEntry]) -> None:
+    """
+    Writes the transformed ``entries`` to the directory ``path``.
+
+    Every array field is written as the concatenation of its flattened values,
+    entry by entry, with the offsets and shapes of the entries; the start
+    dates and the other fields, which must be JSON serializable, are written to
+    the metadata file together with ``cache_versions``.
+    """
+    path.mkdir(parents=True)
+    files: Dict[str, Any] = {}
+    arrays: Dict[str, Dict[str, Any]] = {}
+    fields: Dict[str, List[Any]] = {}
+    num_entries = 0
+    try:
+        for entry in entries:
+            for name, value in entry.items():
+                if isinstance(value, np.ndarray):
+                    if name not in arrays:
+                        files[name] = (path / f"{name}.bin").open("wb")
+                        arrays[name] = {
+                            "dtype": value.dtype.str,
+                            "offsets": [0],
+                            "shapes": [],
+                        }
+                    value = np.ascontiguousarray(value, dtype=arrays[name]["dtype"])
+                    files[name].write(value.data)
+                    arrays[name]["offsets"].append(
+                        arrays[name]["offsets"][-1] + value.size
+                    )
+                    arrays[name]["shapes"].append(value.shape)
+                elif name == FieldName.START:
+                    fields.setdefault(name, []).append([str(value), value.freqstr])
+                else:
+                    fields.setdefault(name, []).append(value)
+            num_entries += 1
+    finally:
+        for f in files.values():
+            f.close()
+
+    for name, array in arrays.items():
+        if len(array["shapes"]) != num_entries:
+            raise ValueError(f"Field {name} is not an array in all entries")
+        np.save(path / f"{name}_offsets.npy", np.asarray(array.pop("offsets")))
+        np.save(path / f"{name}_shapes.npy", np.asarray(array.pop("shapes")))
+
+    with (path / METADATA_FILE).open("w") as f:
+        json.dump(
+            {
+                "versions": cache_versions(),
+                "num_entries": num_entries,
+                "arrays": arrays,
+                "fields": fields,
+            },
+            f,
+        )
+
+
+class MemmapTransformedDataset:
+    """
+    Dataset of transformed entries written by ``save_transformed_dataset``.
+
+    The arrays are memory-mapped, entries get read-only views of them. The
+    arrays are mapped again after unpickling, e.g. in ``DataLoader`` workers,
+    instead of being pickled.
+    """
+
+    def __init__(self, path: Path) -> None:
+        with (path / METADATA_FILE).open() as f:
+            metadata = json.load(f)
+
+        self.path = path
+        self.num_entries = metadata["num_entries"]
+        self.dtypes = {
+            name: np.dtype(array["dtype"]) for name, array in metadata["arrays"].items()
+        }
+        self.fields = metadata["fields"]
+        self.arrays: Optional[Dict[str, Tuple[Any, Any, Any]]] = None
+
+    def _map_arrays(self) -> Dict[str, Tuple[Any, Any, Any]]:
+        arrays = {}
+        for name, dtype in self.dtypes.items():
+            offsets = np.load(self.path / f"{name}_offsets.npy")
+            arrays[name] = (
+                np.memmap(
+                    self.path / f"{name}.bin",
+                    dtype=dtype,
+                    mode="r",
+                    shape=(offsets[-1],),
+                )
+                if offsets[-1] > 0
+                else np.empty(0, dtype=dtype),
+                offsets,
+                np.load(self.path / f"{name}_shapes.npy"),
+            )
+        return arrays
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {**self.__dict__, "arrays": None}
+
+    def __len__(self) -> int:
+        return self.num_entries  # type: ignore
+
+    def __iter__(self) -> Iterator[DataEntry]:
+        if self.arrays is None:
+            self.arrays = self._map_arrays()
+
+        for i in range(self.num_entries):
+            entry: DataEntry = {
+                name: values[offsets[i] : offsets[i + 1]].reshape(shapes[i])
+                for name, (values, offsets, shapes) in self.arrays.items()
+            }
+            for name, values in self.fields.items():
+                if name == FieldName.START:
+                    entry[name] = pd.Period(values[i][0], freq=values[i][1])
+                else:
+                    entry[name] = values[i]
+            yield entry
+
+
+def remove_stale_caches(cache_dir: str) -> List[str]:
+    """
+    Removes the caches in ``cache_dir`` written with other ``cache_versions``.
+
+    Their keys can not be computed anymore, so they would never be read again.
+    Returns the keys of the removed caches.
+    """
+    versions = cache_versions()
+    removed = []
+    for path in Path(cache_dir).iterdir():
+        metadata_file = path / METADATA_FILE
+        if not metadata_file.exists():
+            continue
+        with metadata_file.open() as f:
+            if json.load(f).get("versions") == versions:
+                continue
+        shutil.rmtree(path, ignore_errors=True)
+        removed.append(path.name)
+    return removed
+
+
+def cached_transformation(
+    cache_dir: str,
+    transformation: Transformation,
+    data: Dataset,
+    is_train: bool = True,
+) -> MemmapTransformedDataset:
+    """
+    Returns ``data`` transformed by ``transformation``, from a cache on disk.
+
+    The transformed entries are written to ``cache_dir`` once per
+    transformation, dataset and ``is_train``, keyed by a hash of the
+    serialized transformation and of the dataset content, and are
+    memory-mapped by later calls, also in other processes.
+
+    Caches of other versions are removed whenever a new cache is written, see
+    ``remove_stale_caches``. Caches of other transformations or datasets are
+    kept, every one a full copy of its transformed dataset, until
+    ``cache_dir`` is deleted.
+    """
+    key = transformation_key(transformation, data, is_train)
+    path = Path(cache_dir) / key
+    if not (path / METADATA_FILE).exists():
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        with artifact_lock(cache_dir, key):
+            # another process may have written the cache in the meantime
+            if not (path / METADATA_FILE).exists():
+                tmp_path = path.with_name(f"{key}.tmp{os.getpid()}")
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                try:
+                    save_transformed_dataset(
+                        tmp_path, iter(transformation.apply(data, is_train=is_train))
+                    )
+                    tmp_path.replace(path)
+                finally:
+                    if tmp_path.exists():
+                        shutil.rmtree(tmp_path)
+                remove_stale_caches(cache_dir)
+
+    return MemmapTransformedDataset(path)
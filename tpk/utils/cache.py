@@ -0,0 +1,39 @@
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
+
+
+@contextmanager
+def atomic_path(path: Path) -> Iterator[Path]:
+    """Yields a temporary path which is moved to ``path`` on success.
+
+    The temporary path keeps the suffix of ``path``, so it can be passed to
+    writers such as ``np.save`` which append a missing suffix.
+    """
+    tmp_path = path.with_name(f"{path.stem}.tmp{os.getpid()}{path.suffix}")
+    try:
+        yield tmp_path
+        tmp_path.replace(path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+@contextmanager
+def artifact_lock(data_dir: str, artifact: str) -> Iterator[None]:
+    """Holds an exclusive lock for (re)building ``artifact`` in ``data_dir``."""
+    lock_file = Path(data_dir) / f".{artifact.replace('/', '_')}.lock"
+    with lock_file.open("w") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)